@@ -0,0 +1,211 @@
+"""Persistent history of quiz answers in a local SQLite database.
+
+Answers are handed to a background writer thread, which inserts them in batches (one transaction per batch), so the UI
+thread never waits on disk. The database is in WAL mode, so queries can run while the writer is busy.
+
+Spots are stored as their index tuple joined with commas (e.g. '4,3,5'), and hands as flat hand ids
+(row_i * 13 + col_i).
+"""
+import queue
+import logging
+import sqlite3
+import threading
+
+import numpy as np
+
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS answers (
+    id INTEGER PRIMARY KEY,
+    timestamp REAL NOT NULL,
+    range_dict TEXT NOT NULL,
+    spot TEXT NOT NULL,
+    hand_id INTEGER NOT NULL,
+    selected_option TEXT NOT NULL,
+    correct_action TEXT NOT NULL,
+    is_correct INTEGER NOT NULL,
+    response_time REAL
+);
+CREATE INDEX IF NOT EXISTS answers_by_spot_and_hand ON answers (range_dict, spot, hand_id, is_correct);
+"""
+
+INSERT = """
+INSERT INTO answers (timestamp, range_dict, spot, hand_id, selected_option, correct_action, is_correct, response_time)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+
+def spot_key(spot_indices):
+
+    return ','.join(str(index) for index in spot_indices)
+
+
+def spot_indices_from_key(key):
+
+    return tuple(int(index) for index in key.split(','))
+
+
+def connect(path):
+
+    connection = sqlite3.connect(path, check_same_thread=False)
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute('PRAGMA synchronous=NORMAL')
+
+    return connection
+
+
+def open_answer_history(path):
+    """Returns the answer history at `path`, or None if it can't be opened (e.g. in a read-only directory)."""
+
+    try:
+        return AnswerHistory(path)
+    except sqlite3.Error:
+        logger.exception('Could not open the answer history %s. Answers won\'t be recorded.', path)
+        return None
+
+
+class AnswerHistory:
+
+    def __init__(self, path, batch_size=512):
+
+        self.path = path
+        self.batch_size = batch_size
+
+        self.__read_lock = threading.Lock()
+        self.__read_connection = connect(path)
+        self.__read_connection.executescript(SCHEMA)
+        # Answers recorded from now on get higher ids, which sets them apart from those of earlier sessions.
+        self.initial_last_id = self.__query('SELECT COALESCE(MAX(id), 0) FROM answers')[0][0]
+
+        self.__queue = queue.Queue()
+        self.__closed = False
+        # Set if the writer thread couldn't open the database. Answers recorded after that are dropped.
+        self.__writer_error = None
+        self.__writer = threading.Thread(target=self.__write_batches, name='answer_history_writer', daemon=True)
+        self.__writer.start()
+
+    def record(self, timestamp, range_dict, spot_indices, hand_id, selected_option, correct_action, is_correct,
+               response_time=None):
+        """Queues an answer for writing and returns at once. Write errors are logged, never raised."""
+
+        if self.__closed:
+            raise ValueError('The answer history is closed.')
+        if self.__writer_error is not None:
+            return
+
+        self.__queue.put((timestamp, range_dict, spot_key(spot_indices), int(hand_id), selected_option,
+                          correct_action, int(bool(is_correct)), response_time))
+
+    def flush(self):
+        """Blocks until every answer recorded so far has been written."""
+
+        self.__queue.join()
+
+    def close(self):
+
+        if self.__closed:
+            return
+        self.__closed = True
+        self.__queue.put(None)
+        self.__writer.join()
+        with self.__read_lock:
+            self.__read_connection.close()
+
+    def __write_batches(self):
+        """Writes the queued answers until `close`. A batch that fails to insert (e.g. the database is locked or the
+        disk is full) is logged and dropped, and the writer goes on with the next one."""
+
+        try:
+            connection = connect(self.path)
+        except sqlite3.Error as error:
+            logger.exception('Could not open the answer history %s for writing.', self.path)
+            self.__writer_error = error
+            connection = None
+
+        while True:
+            batch = [self.__queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.__queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            rows = [row for row in batch if row is not None]
+            try:
+                if rows and connection is not None:
+                    with connection:
+                        connection.executemany(INSERT, rows)
+            except sqlite3.Error:
+                logger.exception('Could not write %d answers to the answer history %s.', len(rows), self.path)
+            finally:
+                for _ in batch:
+                    self.__queue.task_done()
+
+            if len(rows) < len(batch):
+                if connection is not None:
+                    connection.close()
+                return
+
+    def __query(self, sql, parameters=()):
+
+        with self.__read_lock:
+            return self.__read_connection.execute(sql, parameters).fetchall()
+
+    def __len__(self):
+
+        return self.count()
+
+    def count(self, up_to_id=None):
+        """Returns the number of answers, or of those with an id up to `up_to_id` if given."""
+
+        if up_to_id is None:
+            return self.__query('SELECT COUNT(*) FROM answers')[0][0]
+
+        return self.__query('SELECT COUNT(*) FROM answers WHERE id <= ?', (up_to_id,))[0][0]
+
+    def spot_accuracy(self, range_dict):
+        """Returns {spot indices: (number of answers, number of correct answers)} for every spot of a range dict."""
+
+        rows = self.__query('SELECT spot, COUNT(*), SUM(is_correct) FROM answers WHERE range_dict = ? GROUP BY spot',
+                            (range_dict,))
+
+        return {spot_indices_from_key(key): (num_answers, num_correct) for key, num_answers, num_correct in rows}
+
+    def hand_counts(self, up_to_id=None):
+        """Returns (range dict, spot indices, hand id, number of answers, number of correct answers) rows, counting
+        only the answers with an id up to `up_to_id` if given."""
+
+        where = 'WHERE id <= ? ' if up_to_id is not None else ''
+        rows = self.__query('SELECT range_dict, spot, hand_id, COUNT(*), SUM(is_correct) FROM answers ' + where +
+                            'GROUP BY range_dict, spot, hand_id', (up_to_id,) if up_to_id is not None else ())
+
+        return [(range_dict, spot_indices_from_key(key), hand_id, num_answers, num_correct)
+                for range_dict, key, hand_id, num_answers, num_correct in rows]
+
+    def answers(self, after_id=0, up_to_id=None):
+        """Returns (timestamp, range dict, spot indices, hand id, is correct) rows of the answers with an id above
+        `after_id` (and up to `up_to_id` if given), oldest first."""
+
+        where = 'WHERE id > ? AND id <= ? ' if up_to_id is not None else 'WHERE id > ? '
+        rows = self.__query('SELECT timestamp, range_dict, spot, hand_id, is_correct FROM answers ' + where +
+                            'ORDER BY id', (after_id, up_to_id) if up_to_id is not None else (after_id,))
+
+        return [(timestamp, range_dict, spot_indices_from_key(key), hand_id, bool(is_correct))
+                for timestamp, range_dict, key, hand_id, is_correct in rows]
+
+    def hand_accuracy(self, range_dict, spot_indices):
+        """Returns the number of answers and of correct answers for each hand of a spot, as two 13x13 arrays."""
+
+        rows = self.__query('SELECT hand_id, COUNT(*), SUM(is_correct) FROM answers '
+                            'WHERE range_dict = ? AND spot = ? GROUP BY hand_id',
+                            (range_dict, spot_key(spot_indices)))
+
+        num_answers = np.zeros(13 * 13, dtype=np.int64)
+        num_correct = np.zeros(13 * 13, dtype=np.int64)
+        for hand_id, hand_num_answers, hand_num_correct in rows:
+            num_answers[hand_id] = hand_num_answers
+            num_correct[hand_id] = hand_num_correct
+
+        return num_answers.reshape((13, 13)), num_correct.reshape((13, 13))
@@ -0,0 +1,121 @@
+import numpy as np
+
+
+FOLD = 'Fold'
+CHECK = 'Check'
+
+
+class AnswerTable:
+    """The hand quiz answers of every spot and hand of a compiled range dict, worked out in one pass.
+
+    Actions are coded as small ints: the distinct choices of the 'Action' label in schema order, then 'Fold' and
+    'Check'. Spots are indexed like `CompiledRangeDict.spot_lookup`, by full index tuple, so a leaf above the full
+    schema depth appears once for every choice of the labels below it.
+
+    `correct_actions[indices + (hand_id,)]` is the code of the correct action (-1 where there is no spot), and bit `code`
+    of `accepted_actions[indices + (hand_id,)]` is set if answering that action is graded as correct. The two differ
+    where ranges overlap: each overlapping action is accepted, but only the first one in the order of
+    `alternatives_dict` counts as the correct action.
+    """
+
+    def __init__(self, compiled_range_dict, alternatives_dict):
+
+        compiled_range_dict.load_all()
+        self.action_axis = compiled_range_dict.labels.index('Action')
+        action_choices = compiled_range_dict.schema['Action']
+        self.action_names = list(dict.fromkeys(action_choices)) + [FOLD, CHECK]
+        self.action_codes = {action: code for code, action in enumerate(self.action_names)}
+        accepted_dtype = np.min_scalar_type(1 << (len(self.action_names) - 1))
+
+        # Move the action axis to the front so that each action's spots are one slice.
+        spot_lookup = np.moveaxis(compiled_range_dict.spot_lookup, self.action_axis, 0)
+        flat_ranges = compiled_range_dict.flat_ranges.reshape((-1, 13 * 13))
+        present = spot_lookup >= 0
+
+        # in_range[code] says whether each hand is in the range of that action, at every spot with the action swapped.
+        choice_indices = compiled_range_dict.choice_indices[self.action_axis]
+        in_range = np.zeros((len(self.action_names) - 2,) + spot_lookup.shape[1:] + (13 * 13,), dtype=bool)
+        for code, action in enumerate(self.action_names[:-2]):
+            action_spot_lookup = spot_lookup[choice_indices[action]]
+            in_range[code] = flat_ranges[action_spot_lookup] & (action_spot_lookup >= 0)[..., np.newaxis]
+        in_range_bits = np.zeros(in_range.shape[1:], dtype=accepted_dtype)
+        for code in range(len(in_range)):
+            in_range_bits |= in_range[code].astype(accepted_dtype) << code
+
+        correct_actions = np.full(spot_lookup.shape + (13 * 13,), -1, dtype=np.int8)
+        accepted_actions = np.zeros(spot_lookup.shape + (13 * 13,), dtype=accepted_dtype)
+        for choice_index, action in enumerate(action_choices):
+            current_code = self.action_codes[action]
+            alternative_codes = [self.action_codes[alternative_action]
+                                 for alternative_action in alternatives_dict.get(action, [])
+                                 if alternative_action in self.action_codes]
+            default_code = self.action_codes[CHECK if action == 'Raise vs limp' else FOLD]
+
+            correct = np.full(in_range.shape[1:], default_code, dtype=np.int8)
+            for code in reversed([current_code] + alternative_codes):
+                correct[in_range[code]] = code
+            combined = in_range[[current_code] + alternative_codes].any(axis=0)
+
+            accepted = in_range_bits | (~combined).astype(accepted_dtype) << self.action_codes[FOLD]
+            accepted |= (~in_range[current_code]).astype(accepted_dtype) << self.action_codes[CHECK]
+
+            spot_present = present[choice_index][..., np.newaxis]
+            correct_actions[choice_index] = np.where(spot_present, correct, -1)
+            accepted_actions[choice_index] = np.where(spot_present, accepted, 0)
+
+        self.correct_actions = np.moveaxis(correct_actions, 0, self.action_axis)
+        self.accepted_actions = np.moveaxis(accepted_actions, 0, self.action_axis)
+
+    def __code_at(self, indices, hand_indices):
+
+        code = int(self.correct_actions[tuple(indices) + (hand_indices[0] * 13 + hand_indices[1],)])
+        if code < 0:
+            raise KeyError(indices)
+
+        return code
+
+    def correct_action(self, indices, hand_indices):
+
+        return self.action_names[self.__code_at(indices, hand_indices)]
+
+    def is_accepted(self, indices, hand_indices, action):
+
+        self.__code_at(indices, hand_indices)
+        accepted = int(self.accepted_actions[tuple(indices) + (hand_indices[0] * 13 + hand_indices[1],)])
+
+        return bool((accepted >> self.action_codes[action]) & 1)
+
+    def are_accepted(self, spot_indices, hand_ids, action_codes):
+        """Like `is_accepted`, for many answers at once: an (n, number of labels) array of spot indices and n hand ids
+        and action codes. Returns whether each answer is graded as correct."""
+
+        answer_indices = tuple(np.asarray(spot_indices, dtype=np.intp).T) + (np.asarray(hand_ids, dtype=np.intp),)
+        missing = self.correct_actions[answer_indices] < 0
+        if missing.any():
+            raise KeyError(tuple(np.asarray(spot_indices)[np.argmax(missing)]))
+
+        return ((self.accepted_actions[answer_indices] >> np.asarray(action_codes)) & 1).astype(bool)
+
+    def feedback_range(self, indices, action):
+        """Returns the 13x13 mask of the hands to show as the range of answering `action`: the hands where it's accepted,
+        or for 'Fold' and 'Check', where it isn't."""
+
+        accepted_range = self.accepted_range(indices, action)
+
+        return ~accepted_range if action in {FOLD, CHECK} else accepted_range
+
+    def accepted_range(self, indices, action):
+        """Returns the 13x13 mask of the hands for which answering `action` is graded as correct."""
+
+        if int(self.correct_actions[tuple(indices) + (0,)]) < 0:
+            raise KeyError(indices)
+        accepted = self.accepted_actions[tuple(indices)]
+
+        return ((accepted >> self.action_codes[action]) & 1).astype(bool).reshape((13, 13))
+
+    def correct_action_mask(self, action):
+        """Returns a (*shape, 13, 13) mask of the hands whose correct action is `action`, in every spot."""
+
+        mask = self.correct_actions == self.action_codes[action]
+
+        return mask.reshape(mask.shape[:-1] + (13, 13))
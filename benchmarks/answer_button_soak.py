@@ -0,0 +1,141 @@
+"""Soak test for the hand quiz window.
+
+Plays thousands of hands through the Controller with "Random spot" enabled, so that the answer buttons are set up
+again for every hand, and answers each hand by clicking a button. Fails if the number of widgets, answer buttons or
+slot calls per click grows, or if per-hand latency or Python memory drifts between the start and the end of the run.
+
+Runs headless:
+
+    python benchmarks/answer_button_soak.py [--hands N] [--range-dict NAME]
+"""
+import os
+import sys
+import time
+import random
+import json
+import argparse
+import tempfile
+import tracemalloc
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from PySide2.QtWidgets import QApplication, QPushButton
+
+from controller import Controller
+from model import Model
+from view import View
+
+
+def write_range_dict_list(path, range_dict_name):
+    """Writes a range dict list holding only `range_dict_name`, with an absolute path, so it loads from any cwd."""
+
+    with open(os.path.join(REPO_DIR, 'range_dicts', 'range_dict_list.json'), 'r') as f:
+        range_dict_list = json.load(f)
+    range_dict_descriptor, = [descriptor for descriptor in range_dict_list if descriptor['Name'] == range_dict_name]
+    filepath = os.path.join(REPO_DIR, 'range_dicts', os.path.basename(range_dict_descriptor['Filepath']))
+    with open(path, 'w') as f:
+        json.dump([{'Name': range_dict_name, 'Filepath': filepath}], f)
+
+
+def play_hand(app, controller, quiz_view):
+
+    controller.next_hand_button_slot()
+    buttons = quiz_view.visible_answer_buttons()
+    random.choice(buttons).click()
+    app.processEvents()
+
+
+def measure_window(hands, app, controller, quiz_view):
+
+    start = time.perf_counter()
+    for _ in range(hands):
+        play_hand(app, controller, quiz_view)
+
+    return (time.perf_counter() - start) / hands
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--hands', type=int, default=5000)
+    parser.add_argument('--window', type=int, default=500, help='Hands timed at the start and at the end.')
+    parser.add_argument('--range-dict', default='6max GTO implementable 100bb cash')
+    parser.add_argument('--max-latency-growth', type=float, default=1.5)
+    parser.add_argument('--max-memory-growth', type=int, default=2 * 1024 * 1024)
+    args = parser.parse_args()
+
+    random.seed(0)
+
+    range_dict_list_file = tempfile.NamedTemporaryFile(suffix='.json', delete=False)
+    range_dict_list_file.close()
+    try:
+        write_range_dict_list(range_dict_list_file.name, args.range_dict)
+        app = QApplication([])
+        model = Model(range_dict_list_filepath=range_dict_list_file.name, answer_history_filepath=None,
+                      error_heatmaps_filepath=None)
+    finally:
+        os.remove(range_dict_list_file.name)
+    view = View(model)
+    controller = Controller(model, view)
+
+    model.randomize_range_in_hand_quiz = True
+    model.hand_quiz_marginal_hands_only = False
+    # Review items are meant to accumulate, so they would hide leaks in the quiz window.
+    model.hand_quiz_spaced_repetition = False
+    controller.quiz_button_slot()
+    quiz_view = view.quiz_view
+
+    slot_calls = []
+    quiz_view.answer_button_group.buttonToggled.connect(lambda button, checked: slot_calls.append(checked))
+
+    # Warm up so that the pool holds as many buttons as any spot needs.
+    measure_window(args.window, app, controller, quiz_view)
+    del slot_calls[:]
+
+    num_widgets = len(quiz_view.window.findChildren(QPushButton))
+    num_group_buttons = len(quiz_view.answer_button_group.buttons())
+    tracemalloc.start()
+    start_memory, _ = tracemalloc.get_traced_memory()
+    start_latency = measure_window(args.window, app, controller, quiz_view)
+    start_slot_calls = len(slot_calls)
+
+    for _ in range(max(args.hands - 3 * args.window, 0)):
+        play_hand(app, controller, quiz_view)
+
+    del slot_calls[:]
+    end_latency = measure_window(args.window, app, controller, quiz_view)
+    end_memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    results = {
+        'widgets': (num_widgets, len(quiz_view.window.findChildren(QPushButton))),
+        'group buttons': (num_group_buttons, len(quiz_view.answer_button_group.buttons())),
+        'slot calls per click': (start_slot_calls / args.window, len(slot_calls) / args.window),
+        'latency per hand (ms)': (start_latency * 1000, end_latency * 1000),
+        'traced memory (KiB)': (start_memory / 1024, end_memory / 1024),
+    }
+    for name, (start, end) in results.items():
+        print('{:<24}{:>12.3f}{:>12.3f}'.format(name, start, end))
+
+    failures = []
+    for name in ('widgets', 'group buttons', 'slot calls per click'):
+        start, end = results[name]
+        if end > start:
+            failures.append('{} grew from {} to {}'.format(name, start, end))
+    if end_latency > start_latency * args.max_latency_growth:
+        failures.append('latency per hand grew from {:.3f} ms to {:.3f} ms'.format(start_latency * 1000,
+                                                                                    end_latency * 1000))
+    if end_memory - start_memory > args.max_memory_growth:
+        failures.append('traced memory grew by {} bytes'.format(end_memory - start_memory))
+
+    for failure in failures:
+        print('FAIL: {}'.format(failure))
+
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+
+    sys.exit(main())
@@ -0,0 +1,235 @@
+"""Benchmarks of the Model's hot paths on every range dict in range_dicts/ and on synthetically scaled copies of them.
+
+Scaled copies repeat the choices of a range dict's first label (e.g. every position) 10 or 100 times, so they have 10x
+or 100x as many spots. Operations that don't apply to a range dict (e.g. grading quiz answers in a dict that has no
+'Action' label) are skipped for it.
+
+Every range dict is copied, along with its edit journals, into a temporary directory first, so that the benchmarks
+(which save range dicts, compacting their journals) never touch the files in range_dicts/.
+
+Results are written as JSON. Given a baseline from an earlier run, the run fails if any median time exceeds the
+baseline's by more than the threshold factor:
+
+    python benchmarks/model_benchmarks.py --output results.json
+    python benchmarks/model_benchmarks.py --baseline results.json --threshold 1.25
+"""
+import os
+import sys
+import json
+import glob
+import time
+import random
+import argparse
+import platform
+import itertools
+import shutil
+import statistics
+import tempfile
+from collections import OrderedDict
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+import numpy as np
+
+from compiled_range_dict import CompiledRangeDict
+from edit_journal import JOURNAL_SUFFIX, rotated_journal_paths
+from model import Model
+from range_dict_cache import RangeDictCache
+from range_pack import load_range_dict_file, save_range_dict_file
+
+
+def scaled_range_dict(path, factor):
+    """Returns a copy of a range dict with the choices of its first label repeated `factor` times."""
+
+    top_level_dict = load_range_dict_file(path).to_top_level_dict()
+    schema = top_level_dict['schema']
+    first_label = list(schema.keys())[0]
+
+    scaled_schema = OrderedDict(schema)
+    scaled_schema[first_label] = ['{}#{}'.format(choice, copy_i) if copy_i > 0 else choice
+                                  for copy_i in range(factor) for choice in schema[first_label]]
+    scaled_contents = {}
+    for copy_i in range(factor):
+        for choice, node in top_level_dict['contents'].items():
+            scaled_contents['{}#{}'.format(choice, copy_i) if copy_i > 0 else choice] = node
+
+    return CompiledRangeDict({'schema': scaled_schema, 'contents': scaled_contents})
+
+
+def copy_range_dict(path, work_dir):
+    """Copies a range dict file and its edit journals into `work_dir`. Returns the path of the copy."""
+
+    copy_path = os.path.join(work_dir, os.path.basename(path))
+    shutil.copy2(path, copy_path)
+    journal_paths = [journal_path for _, journal_path in rotated_journal_paths(path)] + [path + JOURNAL_SUFFIX]
+    for journal_path in journal_paths:
+        if os.path.exists(journal_path):
+            shutil.copy2(journal_path, copy_path + journal_path[len(path):])
+
+    return copy_path
+
+
+def spot_settings(model):
+    """Returns a label -> index dict for every valid spot of the loaded range dict."""
+
+    labels = list(model.range_dict_schema.keys())
+    settings = []
+    for indices in itertools.product(*[range(len(model.range_dict_schema[label])) for label in labels]):
+        model.set_radio_button_setting(OrderedDict(zip(labels, indices)))
+        try:
+            model.current_spot_indices
+        except KeyError:
+            continue
+        settings.append(OrderedDict(zip(labels, indices)))
+
+    return settings
+
+
+def time_calls(function, arguments, repeat):
+    """Calls `function` on each argument, `repeat` times over, and returns the median and minimum seconds per call."""
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for argument in arguments:
+            function(argument)
+        timings.append((time.perf_counter() - start) / len(arguments))
+
+    return statistics.median(timings), min(timings)
+
+
+def benchmark_range_dict(name, path, work_dir, repeat, num_spots, rng):
+
+    range_dict_list_filepath = os.path.join(work_dir, 'range_dict_list.json')
+    with open(range_dict_list_filepath, 'w') as f:
+        json.dump([{'Name': name, 'Filepath': path}], f)
+    model = Model(range_dict_list_filepath=range_dict_list_filepath, answer_history_filepath=None,
+                  error_heatmaps_filepath=None)
+
+    all_settings = spot_settings(model)
+    settings = [rng.choice(all_settings) for _ in range(num_spots)]
+    hands = [(rng.randrange(13), rng.randrange(13)) for _ in settings]
+    save_path = os.path.join(work_dir, 'saved' + os.path.splitext(path)[1])
+
+    def load_cold(_):
+        model.range_dict_cache = RangeDictCache()
+        model.load_range_dict()
+
+    def in_spot(operation):
+        def call(i):
+            model.set_radio_button_setting(settings[i])
+            model.hand_quiz_hand_indices = hands[i]
+            return operation()
+        return call
+
+    def answer_is_correct():
+        options = model.hand_quiz_answer_dict['options'][model.current_radio_button_setting['Action']]
+        for option in options:
+            model.hand_quiz_answer_is_correct(option)
+
+    operations = OrderedDict([
+        ('load_range_dict', (load_cold, [None], max(repeat // 10, 3))),
+        ('load_range_dict (cached)', (lambda _: model.load_range_dict(), [None], repeat)),
+        ('set_radio_button_setting', (in_spot(lambda: None), range(num_spots), repeat)),
+        ('reference_range', (in_spot(lambda: model.reference_range), range(num_spots), repeat)),
+        ('applicable_radio_buttons', (in_spot(lambda: model.applicable_radio_buttons), range(num_spots), repeat)),
+        ('marginal_index_pairs', (in_spot(lambda: model.marginal_index_pairs), range(num_spots), repeat)),
+        ('combined_alternatives_range', (in_spot(lambda: model.combined_alternatives_range), range(num_spots),
+                                         repeat)),
+        ('hand_quiz_answer_is_correct', (in_spot(answer_is_correct), range(num_spots), repeat)),
+        ('save_range_dict', (lambda _: model.save_range_dict(save_path).result(), [None], max(repeat // 10, 3))),
+    ])
+
+    results = OrderedDict()
+    for operation_name, (function, arguments, operation_repeat) in operations.items():
+        # Warm up, and leave out the spots the operation doesn't apply to.
+        applicable_arguments = []
+        for argument in arguments:
+            try:
+                function(argument)
+            except (KeyError, ValueError, IndexError):
+                continue
+            applicable_arguments.append(argument)
+        if not applicable_arguments:
+            continue
+        median, minimum = time_calls(function, applicable_arguments, operation_repeat)
+        results[operation_name] = {'median_us': median * 1e6, 'min_us': minimum * 1e6}
+
+    model.flush_edit_journal()
+    if model.answer_history is not None:
+        model.answer_history.close()
+
+    return {'spots': len(all_settings), 'operations': results}
+
+
+def compare(results, baseline, threshold):
+
+    regressions = []
+    for range_dict_name, range_dict_results in results['range_dicts'].items():
+        baseline_operations = baseline['range_dicts'].get(range_dict_name, {}).get('operations', {})
+        for operation_name, timing in range_dict_results['operations'].items():
+            if operation_name in baseline_operations:
+                baseline_median = baseline_operations[operation_name]['median_us']
+                if timing['median_us'] > baseline_median * threshold:
+                    regressions.append('{} / {}: {:.1f} us vs. {:.1f} us'.format(
+                        range_dict_name, operation_name, timing['median_us'], baseline_median))
+
+    return regressions
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--output', help='Write the results to this JSON file.')
+    parser.add_argument('--baseline', help='Compare against the results in this JSON file.')
+    parser.add_argument('--threshold', type=float, default=1.25)
+    parser.add_argument('--scales', type=int, nargs='*', default=[10, 100])
+    parser.add_argument('--repeat', type=int, default=30)
+    parser.add_argument('--spots', type=int, default=200, help='Random spots per repetition.')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    range_dict_paths = sorted(glob.glob(os.path.join(REPO_DIR, 'range_dicts', '*.pkl')) +
+                              glob.glob(os.path.join(REPO_DIR, 'range_dicts', '*.rpk')))
+
+    results = {'environment': {'python': platform.python_version(), 'numpy': np.__version__,
+                               'platform': platform.platform(), 'repeat': args.repeat, 'spots': args.spots},
+               'range_dicts': OrderedDict()}
+    with tempfile.TemporaryDirectory() as work_dir:
+        for source_path in range_dict_paths:
+            name = os.path.basename(source_path)
+            path = copy_range_dict(source_path, work_dir)
+            scaled_paths = [(name, path)]
+            for factor in args.scales:
+                scaled_path = os.path.join(work_dir, '{}x_{}'.format(factor, name))
+                save_range_dict_file(scaled_path, scaled_range_dict(path, factor))
+                scaled_paths.append(('{} x{}'.format(name, factor), scaled_path))
+
+            for range_dict_name, range_dict_path in scaled_paths:
+                range_dict_results = benchmark_range_dict(range_dict_name, range_dict_path, work_dir, args.repeat,
+                                                          args.spots, rng)
+                results['range_dicts'][range_dict_name] = range_dict_results
+                for operation_name, timing in range_dict_results['operations'].items():
+                    print('{:<52}{:<30}{:>12.1f} us'.format(range_dict_name, operation_name, timing['median_us']))
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=4)
+
+    if args.baseline is not None:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        for regression in regressions:
+            print('REGRESSION: {}'.format(regression))
+        if regressions:
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+
+    sys.exit(main())
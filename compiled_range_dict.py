@@ -0,0 +1,284 @@
+import numpy as np
+
+from hand_range import marginal_mask
+
+
+def mask_indices(mask):
+    """Yields the indices of the set bits of an integer bitmask, lowest first."""
+
+    while mask:
+        lowest_bit = mask & -mask
+        yield lowest_bit.bit_length() - 1
+        mask ^= lowest_bit
+
+
+class SchemaTrieNode:
+    """An inner node of a range dict: its child indices (in the order of the original dict) and their bitmask."""
+
+    __slots__ = ('child_indices', 'mask', 'default_index', 'children')
+
+    def __init__(self, child_indices):
+
+        self.child_indices = child_indices
+        self.mask = 0
+        for index in child_indices:
+            self.mask |= 1 << index
+        # The choice that stands in for one that isn't applicable here.
+        self.default_index = child_indices[0]
+        # Child index -> SchemaTrieNode, for the children that are inner nodes.
+        self.children = {}
+
+
+class CompiledRangeDict:
+    """A range dict compiled into one boolean tensor with one axis per schema label.
+
+    Leaves that sit above the full schema depth (e.g. an 'RFI' range that has no 'VS' level) are stored at index 0 of
+    the remaining axes. `spot_lookup` maps every full index tuple to the flat index of the leaf that the nested-dict
+    walk would have ended on, or -1 if there is no such spot.
+
+    A compiled range dict may also be created lazily from a layout and a `range_loader(flat_index)` callable (see
+    range_pack.py). Each leaf is then read the first time it is accessed.
+
+    `trie` indexes the inner nodes by their choices, so the applicable choices at every level of a spot are found in
+    one walk down from the root.
+    """
+
+    def __init__(self, top_level_dict):
+
+        self.__setup(top_level_dict['schema'])
+        self.__compile(top_level_dict['contents'], ())
+        self.trie = self.__build_trie(())
+        self.update_marginal_masks()
+
+    @classmethod
+    def from_layout(cls, schema, children, leaf_prefixes, range_loader):
+
+        compiled_range_dict = cls.__new__(cls)
+        compiled_range_dict.__setup(schema)
+        compiled_range_dict.children = children
+        compiled_range_dict.trie = compiled_range_dict.__build_trie(())
+        for prefix in leaf_prefixes:
+            compiled_range_dict.__add_leaf(prefix)
+        compiled_range_dict.__range_loader = range_loader
+        compiled_range_dict.__unloaded = compiled_range_dict.present.ravel().copy()
+
+        return compiled_range_dict
+
+    def __setup(self, schema):
+
+        self.schema = schema
+        self.labels = list(self.schema.keys())
+        self.shape = tuple(len(self.schema[label]) for label in self.labels)
+        # A choice listed twice in a label (the 6max 'Action' has '4bet' twice) maps to its first index.
+        self.choice_indices = []
+        for label in self.labels:
+            choice_indices = {}
+            for i, choice in enumerate(self.schema[label]):
+                choice_indices.setdefault(choice, i)
+            self.choice_indices.append(choice_indices)
+        self.first_choice_indices = [np.array([choice_indices[choice] for choice in self.schema[label]], dtype=np.int64)
+                                     for choice_indices, label in zip(self.choice_indices, self.labels)]
+
+        self.ranges = np.zeros(self.shape + (13, 13), dtype=bool)
+        self.marginal_masks = np.zeros(self.shape + (13, 13), dtype=bool)
+        self.flat_ranges = self.ranges.reshape((-1, 13, 13))
+        self.flat_marginal_masks = self.marginal_masks.reshape((-1, 13, 13))
+        self.present = np.zeros(self.shape, dtype=bool)
+        self.spot_lookup = np.full(self.shape, -1, dtype=np.int64)
+        # Child indices of every inner node, keyed by index prefix, in the order of the original dict.
+        self.children = {}
+        # Number of cell edits made since loading, and how many of them have been saved.
+        self.edit_count = 0
+        self.saved_edit_count = 0
+
+        self.__range_loader = None
+        self.__unloaded = np.zeros(self.present.size, dtype=bool)
+
+    def __compile(self, node, prefix):
+
+        if type(node) is dict:
+            choice_indices = self.choice_indices[len(prefix)]
+            self.children[prefix] = [choice_indices[key] for key in node.keys()]
+            for key, child in node.items():
+                self.__compile(child, prefix + (choice_indices[key],))
+        else:
+            self.flat_ranges[self.__add_leaf(prefix)] = node
+
+    def __build_trie(self, prefix):
+
+        node = SchemaTrieNode(self.children[prefix])
+        for index in node.child_indices:
+            if prefix + (index,) in self.children:
+                node.children[index] = self.__build_trie(prefix + (index,))
+
+        return node
+
+    def __add_leaf(self, prefix):
+
+        canonical_indices = prefix + (0,) * (len(self.shape) - len(prefix))
+        flat_index = np.ravel_multi_index(canonical_indices, self.shape)
+        self.present[canonical_indices] = True
+        self.spot_lookup[prefix] = flat_index
+
+        return flat_index
+
+    def __ensure_loaded(self, flat_index):
+
+        if self.__unloaded[flat_index]:
+            self.flat_ranges[flat_index] = self.__range_loader(flat_index)
+            self.flat_marginal_masks[flat_index] = marginal_mask(self.flat_ranges[flat_index])
+            self.__unloaded[flat_index] = False
+
+    def load_all(self):
+
+        for flat_index in np.flatnonzero(self.__unloaded):
+            self.__ensure_loaded(flat_index)
+
+    @property
+    def leaf_flat_indices(self):
+
+        return np.flatnonzero(self.present)
+
+    def indices(self, setting):
+
+        return tuple(choice_indices[setting[label]] for choice_indices, label in zip(self.choice_indices, self.labels))
+
+    def canonical_flat_indices(self, flat_indices):
+        """Maps flat indices that use a later copy of a choice listed twice (from files written before choices mapped
+        to their first index) to the flat indices of the first copy."""
+
+        indices = np.unravel_index(np.asarray(flat_indices, dtype=np.int64), self.shape)
+
+        return np.ravel_multi_index(tuple(first_choice_indices[axis_indices] for first_choice_indices, axis_indices
+                                          in zip(self.first_choice_indices, indices)), self.shape)
+
+    def flat_index(self, indices):
+
+        flat_index = int(self.spot_lookup[indices])
+        if flat_index < 0:
+            raise KeyError(indices)
+        self.__ensure_loaded(flat_index)
+
+        return flat_index
+
+    def range_at(self, indices):
+        """Returns a writable view of the range at `indices`."""
+
+        return self.flat_ranges[self.flat_index(indices)]
+
+    def range_at_prefix(self, prefix):
+
+        return self.range_at(prefix + (0,) * (len(self.shape) - len(prefix)))
+
+    def marginal_mask_at(self, indices):
+
+        return self.flat_marginal_masks[self.flat_index(indices)]
+
+    @property
+    def dirty(self):
+
+        return self.edit_count != self.saved_edit_count
+
+    def mark_saved(self, edit_count):
+
+        self.saved_edit_count = edit_count
+
+    def set_cell(self, flat_index, row_i, col_i, value):
+
+        self.__ensure_loaded(flat_index)
+        self.flat_ranges[flat_index, row_i, col_i] = value
+        self.edit_count += 1
+        self.flat_marginal_masks[flat_index] = marginal_mask(self.flat_ranges[flat_index])
+
+    def set_cells(self, flat_indices, hand_ids, values):
+        """Applies many cell edits at once. Later edits of the same cell win."""
+
+        flat_indices = np.asarray(flat_indices, dtype=np.int64)
+        hand_ids = np.asarray(hand_ids, dtype=np.int64)
+        values = np.asarray(values, dtype=bool)
+
+        cell_keys = flat_indices * (13 * 13) + hand_ids
+        _, last_positions = np.unique(cell_keys[::-1], return_index=True)
+        last_positions = len(cell_keys) - 1 - last_positions
+
+        touched_flat_indices = np.unique(flat_indices)
+        for flat_index in touched_flat_indices:
+            self.__ensure_loaded(flat_index)
+        self.flat_ranges.reshape((-1, 13 * 13))[flat_indices[last_positions], hand_ids[last_positions]] = \
+            values[last_positions]
+        self.edit_count += len(flat_indices)
+        self.flat_marginal_masks[touched_flat_indices] = marginal_mask(self.flat_ranges[touched_flat_indices])
+
+    @property
+    def nbytes(self):
+
+        return self.ranges.nbytes + self.marginal_masks.nbytes + self.present.nbytes + self.spot_lookup.nbytes
+
+    def update_marginal_masks(self):
+
+        self.load_all()
+        self.marginal_masks[...] = marginal_mask(self.ranges)
+
+    def applicable_nodes(self, indices):
+        """Returns the trie nodes on the way down to the spot at `indices`, one per level down to its leaf.
+
+        At each level where the choice in `indices` isn't applicable, the walk follows the node's default choice.
+        """
+
+        nodes = []
+        node = self.trie
+        for index in indices:
+            nodes.append(node)
+            if not (node.mask >> index) & 1:
+                index = node.default_index
+            node = node.children.get(index)
+            if node is None:
+                break
+
+        return nodes
+
+    def applicable_spot_indices(self, indices):
+        """Returns `indices` with each choice that isn't applicable, given the choices above it, replaced by the default
+        choice of its node. Choices below the spot's leaf are kept."""
+
+        applicable_indices = list(indices)
+        node = self.trie
+        for depth, index in enumerate(indices):
+            if not (node.mask >> index) & 1:
+                index = applicable_indices[depth] = node.default_index
+            node = node.children.get(index)
+            if node is None:
+                break
+
+        return tuple(applicable_indices)
+
+    def applicable_indices(self, indices):
+
+        return [node.child_indices for node in self.applicable_nodes(indices)]
+
+    def leaf_prefixes(self, prefix=()):
+        """Yields the index prefix of every leaf, in the order of the original dict."""
+
+        for index in self.children[prefix]:
+            child_prefix = prefix + (index,)
+            if child_prefix in self.children:
+                yield from self.leaf_prefixes(child_prefix)
+            else:
+                yield child_prefix
+
+    def to_top_level_dict(self):
+
+        return {'schema': self.schema, 'contents': self.__decompile(())}
+
+    def __decompile(self, prefix):
+
+        choices = self.schema[self.labels[len(prefix)]]
+        node = {}
+        for index in self.children[prefix]:
+            child_prefix = prefix + (index,)
+            if child_prefix in self.children:
+                node[choices[index]] = self.__decompile(child_prefix)
+            else:
+                node[choices[index]] = self.range_at_prefix(child_prefix).copy()
+
+        return node
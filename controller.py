@@ -1,11 +1,27 @@
 import os
 from collections import OrderedDict
-import random
-from PySide2.QtCore import QUrl
-from PySide2.QtWidgets import QInputDialog, QFileDialog, QLineEdit
+import numpy as np
+from PySide2.QtCore import QObject, QTimer, QUrl, Qt, Signal
+from PySide2.QtWidgets import QInputDialog, QFileDialog, QLineEdit, QMessageBox
 
+from compiled_range_dict import mask_indices
+from hand_range import HandRange
 from model import Model
-from view import View, to_list_index
+from quiz_session import QuizSession
+from range_expression import RangeExpressionError
+from view import View
+
+
+class RangeDictLoadSignals(QObject):
+
+    loaded = Signal(int)
+    failed = Signal(int, str)
+
+
+class SavedStateLoadSignals(QObject):
+
+    error_heatmaps_loaded = Signal()
+    review_state_loaded = Signal()
 
 
 class Controller:
@@ -14,29 +30,56 @@ class Controller:
 
         self.model = model
         self.view = view
-
-        self.view.window.shift_key_pressed.connect(self.shift_key_pressed_slot)
-        self.view.window.shift_key_released.connect(self.shift_key_released_slot)
-
-        for row_i in range(13):
-            for col_i in range(13):
-                hand_button_id = to_list_index(row_i, col_i)
-                hand_button = self.view.hand_grid_button_group.button(hand_button_id)
-                button_function = self.__create_hand_button_function(hand_button, row_i, col_i)
-                hand_button.toggled.connect(button_function)
+        self.pending_range_dict_list_index = None
+        self.quiz_session = QuizSession(self.model)
+
+        # Range dicts are loaded on worker threads. These signals carry the results back to the UI thread.
+        self.range_dict_load_signals = RangeDictLoadSignals()
+        self.range_dict_load_signals.loaded.connect(self.range_dict_loaded_slot, Qt.QueuedConnection)
+        self.range_dict_load_signals.failed.connect(self.range_dict_load_failed_slot, Qt.QueuedConnection)
+        # So are the error heatmaps and the spaced repetition state saved by earlier sessions.
+        self.saved_state_load_signals = SavedStateLoadSignals()
+        self.saved_state_load_signals.error_heatmaps_loaded.connect(self.model.finish_loading_error_heatmaps,
+                                                                    Qt.QueuedConnection)
+        self.saved_state_load_signals.review_state_loaded.connect(self.model.finish_loading_review_state,
+                                                                  Qt.QueuedConnection)
+
+        # The error heatmaps and the review state are snapshotted every minute, so that a crash doesn't force a rebuild
+        # from the history.
+        self.snapshot_save_timer = QTimer()
+        self.snapshot_save_timer.setInterval(60000)
+        self.snapshot_save_timer.timeout.connect(self.model.save_snapshots)
+        self.snapshot_save_timer.start()
+
+        # Edits are appended to the range dict's edit journal in small batches.
+        self.edit_journal_flush_timer = QTimer()
+        self.edit_journal_flush_timer.setInterval(2000)
+        self.edit_journal_flush_timer.timeout.connect(self.model.flush_edit_journal)
+
+        # Radio button toggles only mark the spot as changed. The model and the radio buttons are updated once, in the
+        # next turn of the event loop (see `update_radio_buttons`).
+        self.radio_button_update_timer = QTimer()
+        self.radio_button_update_timer.setSingleShot(True)
+        self.radio_button_update_timer.setInterval(0)
+        self.radio_button_update_timer.timeout.connect(self.update_radio_buttons)
+
+        self.view.hand_grid_widget.cells_changed.connect(self.hand_grid_cells_changed_slot)
 
         for range_dict_dict in self.model.range_dict_list:
             self.view.range_dict_list_widget.addItem(range_dict_dict['Name'])
         self.view.range_dict_list_widget.currentIndexChanged.connect(self.range_dict_list_index_change_slot)
         self.view.save_range_dict_button.setEnabled(False)
+        self.view.revert_range_dict_button.setEnabled(False)
         self.view.copy_range_button.setEnabled(False)
         self.view.paste_range_button.setEnabled(False)
         self.view.new_range_dict_button.clicked.connect(self.new_range_dict_button_slot)
         self.view.edit_range_dict_button.toggled.connect(self.edit_range_dict_button_toggled_slot)
         self.view.save_range_dict_button.clicked.connect(self.save_button_slot)
+        self.view.revert_range_dict_button.clicked.connect(self.revert_button_slot)
         self.view.copy_range_button.clicked.connect(self.copy_range_button_slot)
         self.view.paste_range_button.clicked.connect(self.paste_range_button_slot)
         self.view.invert_range_button.clicked.connect(self.invert_range_button_slot)
+        self.view.range_expression_edit.returnPressed.connect(self.range_expression_slot)
 
         for radio_button_group in self.view.radio_button_groups:
             for button in radio_button_group.buttons():
@@ -52,71 +95,35 @@ class Controller:
         self.view.quiz_button.clicked.connect(self.quiz_button_slot)
         self.view.check_button.clicked.connect(self.check_button_slot)
         self.view.reset_button.clicked.connect(self.reset_button_slot)
+        self.view.error_heatmap_button.clicked.connect(self.error_heatmap_button_slot)
 
-        # QuizView items
-
-        self.view.quiz_view.next_hand_button.clicked.connect(self.next_hand_button_slot)
-        self.view.quiz_view.randomize_range_checkbox.toggled.connect(self.randomize_range_checkbox_slot)
-
-    def shift_key_pressed_slot(self):
-
-        for row_i in range(13):
-            for col_i in range(13):
-                hand_button_id = to_list_index(row_i, col_i)
-                hand_button = self.view.hand_grid_button_group.button(hand_button_id)
-                hand_button.shift_key_pressed = True
-                if hand_button.underMouse():
-                    hand_button.toggle()
-
-    def shift_key_released_slot(self):
-
-        for row_i in range(13):
-            for col_i in range(13):
-                hand_button_id = to_list_index(row_i, col_i)
-                hand_button = self.view.hand_grid_button_group.button(hand_button_id)
-                hand_button.shift_key_pressed = False
-
-    def __create_hand_button_function(self, button, button_row, button_col):
-
-        def function():
-            self.model.range_entered[button_row][button_col] ^= True
-            if self.model.editing_mode:
-                self.view.set_editing_mode_color(button)
-                self.model.reference_range[button_row][button_col] = button.isChecked()
-
-        return function
-
-    def __create_hand_button_under_mouse_function(self, button):
-
-        def function():
-            if button.isChecked():
-                button.setChecked(False)
-            else:
-                button.setChecked(True)
-
-        return function
+    def create_quiz_view(self):
 
-    def __create_hand_button_pressed_function(self, button):
+        quiz_view = self.view.create_quiz_view()
+        quiz_view.next_hand_button.clicked.connect(self.next_hand_button_slot)
+        quiz_view.answer_button_group.buttonToggled.connect(self.answer_button_slot)
+        quiz_view.randomize_range_checkbox.toggled.connect(self.randomize_range_checkbox_slot)
+        quiz_view.spaced_repetition_checkbox.toggled.connect(self.spaced_repetition_checkbox_slot)
 
-        def function():
-            if button.isChecked():
-                button.setChecked(False)
-            else:
-                button.setChecked(True)
+    def hand_grid_cells_changed_slot(self, hand_ids):
 
-        return function
+        self.flush_radio_button_update()
+        self.model.set_range(self.view.hand_grid_widget.checked)
+        if self.model.editing_mode:
+            self.view.set_editing_mode_colors()
 
     def uncheck_all_hand_buttons(self):
 
-        for id in range(13 * 13):
-            button = self.view.hand_grid_button_group.button(id)
-            button.setChecked(False)
+        self.view.hand_grid_widget.set_checked(np.zeros(13 * 13, dtype=bool))
 
     def update_model_on_radio_buttons(self):
 
-        checked_ids = [radio_button_group.checkedId() for radio_button_group in self.view.radio_button_groups]
+        # A group with no checked button keeps the model's choice.
+        checked_ids = [radio_button_group.checkedId() if radio_button_group.checkedId() >= 0 else index
+                       for radio_button_group, index in zip(self.view.radio_button_groups,
+                                                            self.model.current_radio_button_indices)]
         label_id_dict = OrderedDict(zip(self.model.range_dict_schema.keys(), checked_ids))
-        self.model.set_radio_button_setting(label_id_dict)
+        self.model.set_applicable_radio_button_setting(label_id_dict)
 
     def disable_all_radio_buttons(self):
 
@@ -129,21 +136,19 @@ class Controller:
 
     def enable_applicable_radio_buttons(self):
 
-        applicable_dict = self.model.applicable_radio_buttons
+        masks, default_ids = self.model.applicable_radio_button_masks
 
-        for i, (group_label, button_labels) in enumerate(applicable_dict.items()):
+        for i, (mask, default_id) in enumerate(zip(masks, default_ids)):
 
-            if len(button_labels) > 0:
+            if mask:
                 label_widget = self.view.radio_button_group_labels[i]
                 label_widget.setEnabled(True)
                 button_group = self.view.radio_button_groups[i]
-                button_ids = [self.model.range_dict_schema[group_label].index(button_label)
-                              for button_label in button_labels]
-                for button_id in button_ids:
+                for button_id in mask_indices(mask):
                     button = button_group.button(button_id)
                     button.setEnabled(True)
                 if (button_group.checkedButton() is None) or (not button_group.checkedButton().isEnabled()):
-                    button_group.button(button_ids[0]).setChecked(True)
+                    button_group.button(default_id).setChecked(True)
 
     def setup_radio_buttons(self):
 
@@ -157,12 +162,62 @@ class Controller:
             button = radio_button_group.button(button_id)
             button.setChecked(True)
 
+    def load_initial_range_dict(self):
+        """Loads the selected range dict on a worker thread, for a Model created without it."""
+
+        self.range_dict_list_index_change_slot(self.view.range_dict_list_widget.currentIndex())
+
+    def preload_range_dicts(self):
+
+        self.model.preload_range_dicts(self.__report_range_dict_load)
+
+    def load_saved_state(self):
+
+        self.model.load_error_heatmaps(lambda exception: self.saved_state_load_signals.error_heatmaps_loaded.emit())
+        self.model.load_review_state(lambda exception: self.saved_state_load_signals.review_state_loaded.emit())
+
+    def __report_range_dict_load(self, range_dict_list_index, exception):
+
+        if exception is None:
+            self.range_dict_load_signals.loaded.emit(range_dict_list_index)
+        else:
+            self.range_dict_load_signals.failed.emit(range_dict_list_index, str(exception))
+
     def range_dict_list_index_change_slot(self, index):
 
+        if self.model.range_dict_is_ready(index):
+            self.display_range_dict(index)
+        else:
+            self.pending_range_dict_list_index = index
+            self.view.set_range_dict_loading(True)
+            self.disable_all_radio_buttons()
+            self.model.preload_range_dict(index, self.__report_range_dict_load)
+
+    def range_dict_loaded_slot(self, index):
+
+        if index == self.pending_range_dict_list_index:
+            self.display_range_dict(index)
+
+    def range_dict_load_failed_slot(self, index, message):
+
+        if index == self.pending_range_dict_list_index:
+            self.pending_range_dict_list_index = None
+            self.view.set_range_dict_load_failed(message)
+            self.view.range_dict_list_widget.blockSignals(True)
+            self.view.range_dict_list_widget.setCurrentIndex(self.model.current_range_dict_list_index)
+            self.view.range_dict_list_widget.blockSignals(False)
+            if self.model.range_dict_loaded:
+                self.enable_applicable_radio_buttons()
+
+    def display_range_dict(self, index):
+
+        self.pending_range_dict_list_index = None
         self.model.current_range_dict_list_index = index
         self.model.load_range_dict()
+        self.view.set_range_dict_loading(False)
         self.view.clear_radio_button_parent_layout()
         self.view.populate_radio_button_parent_layout()
+        self.view.populate_error_heatmap_scope_widget()
         self.model.check_default_radio_buttons()
         self.setup_radio_buttons()
         self.disable_all_radio_buttons()
@@ -191,26 +246,30 @@ class Controller:
 
     def edit_range_dict_button_checked_slot(self):
 
+        self.flush_radio_button_update()
         self.model.editing_mode = True
+        self.edit_journal_flush_timer.start()
         self.view.random_button.setEnabled(False)
         self.view.quiz_button.setEnabled(False)
         self.view.check_button.setEnabled(False)
+        self.view.error_heatmap_button.setEnabled(False)
         self.view.save_range_dict_button.setEnabled(True)
+        self.view.revert_range_dict_button.setEnabled(True)
         self.view.copy_range_button.setEnabled(True)
+        self.view.hand_grid_widget.set_checked(self.model.reference_range)
         self.view.set_editing_mode_colors()
-        for row_i in range(13):
-            for col_i in range(13):
-                hand_button_id = to_list_index(row_i, col_i)
-                hand_button = self.view.hand_grid_button_group.button(hand_button_id)
-                hand_button.setChecked(self.model.reference_range[row_i][col_i])
 
     def edit_range_dict_button_unchecked_slot(self):
 
         self.model.editing_mode = False
+        self.edit_journal_flush_timer.stop()
+        self.model.flush_edit_journal()
         self.view.random_button.setEnabled(True)
         self.view.quiz_button.setEnabled(True)
         self.view.check_button.setEnabled(True)
+        self.view.error_heatmap_button.setEnabled(True)
         self.view.save_range_dict_button.setEnabled(False)
+        self.view.revert_range_dict_button.setEnabled(False)
         self.view.copy_range_button.setEnabled(False)
         self.view.paste_range_button.setEnabled(False)
         self.view.reset_colors()
@@ -222,9 +281,9 @@ class Controller:
         url, clicked_save = QFileDialog.getSaveFileUrl(self.view.window,
                                                        'Save range dict',
                                                        default_url,
-                                                       'Pickle files (*.pkl)')
+                                                       'Pickle files (*.pkl);;Range packs (*.rpk)')
         if clicked_save:
-            if len(url.path()) < 4 or url.path()[-4:] != '.pkl':
+            if os.path.splitext(url.path())[1] not in {'.pkl', '.rpk'}:
                 target_path = '{}{}'.format(url.path(), '.pkl')
             else:
                 target_path = url.path()
@@ -232,67 +291,119 @@ class Controller:
             self.model.save_range_dict(target_path)
             self.model.save_range_dict_list()
 
+    def revert_button_slot(self):
+
+        answer = QMessageBox.question(self.view.window, self.view.revert_range_dict_dialog_title,
+                                      self.view.revert_range_dict_dialog_text)
+        if answer == QMessageBox.Yes:
+            self.flush_radio_button_update()
+            self.model.revert_range_dict()
+            self.view.hand_grid_widget.set_checked(self.model.reference_range)
+            self.view.set_editing_mode_colors()
+
     def copy_range_button_slot(self):
 
-        self.model.copied_range = self.model.reference_range
+        self.flush_radio_button_update()
+        self.model.copied_range = HandRange.from_array(self.model.reference_range)
         self.view.paste_range_button.setEnabled(True)
 
     def paste_range_button_slot(self):
 
-        for row_i in range(13):
-            for col_i in range(13):
-                hand_button_id = to_list_index(row_i, col_i)
-                hand_button = self.view.hand_grid_button_group.button(hand_button_id)
-                hand_button.setChecked(self.model.copied_range[row_i][col_i])
+        self.view.hand_grid_widget.set_checked(self.model.copied_range)
 
     def invert_range_button_slot(self):
 
-        for row_i in range(13):
-            for col_i in range(13):
-                hand_button_id = to_list_index(row_i, col_i)
-                hand_button = self.view.hand_grid_button_group.button(hand_button_id)
-                hand_button.toggle()
+        self.view.hand_grid_widget.set_checked(~self.view.hand_grid_widget.checked)
+
+    def range_expression_slot(self):
+
+        try:
+            hand_range = self.model.range_from_expression(self.view.range_expression_edit.text())
+        except RangeExpressionError as error:
+            self.view.display_range_expression_error(str(error))
+            return
+
+        self.view.display_range_expression_error(None)
+        self.view.hand_grid_widget.set_checked(hand_range)
 
     def radio_button_slot(self):
+        """Schedules `update_radio_buttons`. The toggles of a click (and any made while updating) are coalesced."""
+
+        if not self.radio_button_update_timer.isActive():
+            self.radio_button_update_timer.start()
+
+    def flush_radio_button_update(self):
+        """Runs a scheduled `update_radio_buttons` right away. Called by the slots that use the model's current spot."""
+
+        if self.radio_button_update_timer.isActive():
+            self.radio_button_update_timer.stop()
+            self.update_radio_buttons()
+
+    def update_radio_buttons(self):
+        """Sets the model's spot to the checked radio buttons, then shows it on them in one pass.
+
+        Choices that aren't applicable are replaced in the model, so the buttons are never corrected by checking others
+        (which would toggle and schedule another update).
+        """
 
         self.update_model_on_radio_buttons()
-        self.disable_all_radio_buttons()
-        self.enable_applicable_radio_buttons()
+        self.check_model_radio_buttons()
         if self.model.editing_mode:
-            for row_i in range(13):
-                for col_i in range(13):
-                    hand_button_id = to_list_index(row_i, col_i)
-                    hand_button = self.view.hand_grid_button_group.button(hand_button_id)
-                    hand_button.setChecked(self.model.reference_range[row_i][col_i])
+            self.view.hand_grid_widget.set_checked(self.model.reference_range)
 
     def random_button_slot(self):
 
-        for radio_button_group in self.view.radio_button_groups:
-            enabled_radio_buttons = [radio_button for radio_button in radio_button_group.buttons()
-                                     if radio_button.isEnabled()]
-            if len(enabled_radio_buttons) > 0:
-                random_radio_button = random.choice(enabled_radio_buttons)
-                random_radio_button.setChecked(True)
-            else:
-                break
+        self.flush_radio_button_update()
+        self.model.set_radio_button_setting(self.model.random_radio_button_setting())
+        self.check_model_radio_buttons()
+
+    def check_model_radio_buttons(self):
+        """Shows the model's current setting on the radio buttons without triggering `radio_button_slot`.
+
+        The setting must be a spot of the range dict. Each button is checked and enabled or disabled in one pass, and
+        the window is repainted once at the end.
+        """
+
+        masks, _ = self.model.applicable_radio_button_masks
+
+        self.view.window.setUpdatesEnabled(False)
+        for i, button_id in enumerate(self.model.current_radio_button_indices):
+            self.view.radio_button_group_labels[i].setEnabled(masks[i] != 0)
+            radio_button_group = self.view.radio_button_groups[i]
+            for radio_button in radio_button_group.buttons():
+                radio_button.blockSignals(True)
+                radio_button.setEnabled(bool((masks[i] >> radio_button_group.id(radio_button)) & 1))
+            radio_button_group.button(button_id).setChecked(True)
+            for radio_button in radio_button_group.buttons():
+                radio_button.blockSignals(False)
+        self.view.window.setUpdatesEnabled(True)
 
     def quiz_button_slot(self):
 
+        self.flush_radio_button_update()
         self.reset_button_slot()
-        self.draw_random_hand_indices()
-        self.view.quiz_view.populate_window()
-        self.connect_answer_buttons()
+        if self.view.quiz_view is None:
+            self.create_quiz_view()
+        self.view.quiz_view.display_question(self.quiz_session.next_question(randomize_spot=False))
         self.view.quiz_view.window.show()
 
     def check_button_slot(self):
 
-        self.update_model_on_radio_buttons()
-        comparison_array = self.model.range_entered.astype(int) - self.model.reference_range.astype(int)
-        self.model.incorrectly_checked = comparison_array == 1
-        self.model.incorrectly_left_unchecked = comparison_array == -1
-        self.model.correctly_checked = self.model.range_entered & self.model.reference_range
+        self.flush_radio_button_update()
+        range_entered = HandRange.from_array(self.model.range_entered)
+        reference_range = HandRange.from_array(self.model.reference_range)
+        self.model.incorrectly_checked = range_entered - reference_range
+        self.model.incorrectly_left_unchecked = reference_range - range_entered
+        self.model.correctly_checked = range_entered & reference_range
         self.view.display_feedback()
 
+    def error_heatmap_button_slot(self):
+
+        self.flush_radio_button_update()
+        scope_index = self.view.error_heatmap_scope_widget.currentIndex()
+        axis = scope_index - 1 if scope_index > 0 else None
+        self.view.display_error_heatmap(self.model.current_error_rates(axis))
+
     def reset_button_slot(self):
 
         self.uncheck_all_hand_buttons()
@@ -300,39 +411,13 @@ class Controller:
 
     # QuizView slots
 
-    def connect_answer_buttons(self):
-
-        for button in self.view.quiz_view.answer_button_group.buttons():
-            button.toggled.connect(self.answer_button_slot)
-
-    def draw_random_hand_indices(self):
-
-        if self.model.hand_quiz_marginal_hands_only:
-            self.model.hand_quiz_hand_indices = random.choice(self.model.marginal_index_pairs)
-        else:
-            row_i = random.randint(0, 12)
-            col_i = random.randint(0, 12)
-
-            self.model.hand_quiz_hand_indices = (row_i, col_i)
-
     def next_hand_button_slot(self):
 
+        self.flush_radio_button_update()
+        question = self.quiz_session.next_question()
         if self.model.randomize_range_in_hand_quiz:
-            self.random_button_slot()
-            self.draw_random_hand_indices()
-            self.view.quiz_view.populate_window()
-            self.connect_answer_buttons()
-        else:
-            self.draw_random_hand_indices()
-            self.view.quiz_view.display_next_hand(marginal_only=False)
-            self.reset_answer_buttons()
-
-    def reset_answer_buttons(self):
-
-        for button in self.view.quiz_view.answer_button_group.buttons():
-            if button.isChecked():
-                button.toggle()
-            button.setStyleSheet('background-color: white')
+            self.check_model_radio_buttons()
+        self.view.quiz_view.display_question(question)
 
     def randomize_range_checkbox_slot(self):
 
@@ -341,31 +426,14 @@ class Controller:
         else:
             self.model.randomize_range_in_hand_quiz = False
 
-    def marginal_only_checkbox_slot(self):
+    def spaced_repetition_checkbox_slot(self):
 
-        if self.view.quiz_view.marginal_only_checkbox.isChecked():
-            self.model.hand_quiz_marginal_hands_only = True
-        else:
-            self.model.hand_quiz_marginal_hands_only = False
+        self.model.hand_quiz_spaced_repetition = self.view.quiz_view.spaced_repetition_checkbox.isChecked()
 
     def answer_button_slot(self):
 
         checked_button = self.view.quiz_view.answer_button_group.checkedButton()
         if checked_button is not None:
-            selected_answer = checked_button.text()
-            # TODO: This doesn't check whether the answer is correct or not. Fix.
-            is_correct = self.model.hand_quiz_answer_is_correct(selected_answer)
-            if is_correct:
-                checked_button.setStyleSheet('background-color: green')
-            else:
-                checked_button.setStyleSheet('background-color: red')
-                correct_action = self.model.hand_quiz_correct_action
-                if correct_action in self.model.action_to_quiz_option_dict:
-                    correct_button_label = self.model.action_to_quiz_option_dict[correct_action]
-                else:
-                    correct_button_label = correct_action
-                for button in self.view.quiz_view.answer_button_group.buttons():
-                    if button.text() == correct_button_label:
-                        button.setStyleSheet('background-color: green')
-                        break
-            self.view.display_quiz_feedback(selected_answer, is_correct)
+            answer = self.quiz_session.answer(checked_button.text())
+            self.view.quiz_view.display_answer(answer)
+            self.view.display_quiz_feedback(answer)
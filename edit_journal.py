@@ -0,0 +1,188 @@
+"""Append-only journals of range dict edits.
+
+Each range dict file may have a journal next to it (`<path>.journal`) holding the cell edits made since the file was
+last written. A record is the flat spot index, the flat hand id (row_i * 13 + col_i) and the new value. Records hold
+absolute values, so replaying a journal twice gives the same result, and a torn record at the end of a journal (after
+a crash) is ignored.
+
+When a range dict is compacted into its base file, the journal is first rotated to `<path>.journal.<generation>` and
+new edits go to a fresh journal. Once the base file has been replaced, the rotated journals up to that generation are
+removed. Until then they are replayed, oldest first, ahead of the live journal.
+
+A journal starts with a header naming the base file it was written against, by size and mtime. A journal that doesn't
+match the base file (e.g. after the file was replaced or reconverted) is discarded instead of being replayed onto a
+layout it wasn't written for. While a base file is being replaced, the live journal matches both the old and the new
+file. Journals written before the header was added are replayed only if their records fit the range dict.
+"""
+import os
+import glob
+import threading
+
+import numpy as np
+
+
+JOURNAL_SUFFIX = '.journal'
+HEADER_MAGIC = b'RTJRNL01'
+# Up to two (size, mtime ns) identities of base files; unused ones are (-1, -1).
+MAX_BASE_IDENTITIES = 2
+
+record_dtype = np.dtype([('flat_index', '<u4'), ('hand_id', 'u1'), ('value', 'u1')])
+header_dtype = np.dtype([('magic', 'S8'), ('base_identities', '<i8', (MAX_BASE_IDENTITIES, 2))])
+
+
+def base_file_identity(path):
+    """Returns (size, mtime ns) of a base file, or None if it doesn't exist."""
+
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+
+    return stat.st_size, stat.st_mtime_ns
+
+
+def journal_header(base_identities):
+
+    header = np.zeros(1, dtype=header_dtype)
+    header['magic'] = HEADER_MAGIC
+    header['base_identities'] = -1
+    identities = [identity for identity in base_identities if identity is not None]
+    header['base_identities'][0, :len(identities)] = identities
+
+    return header.tobytes()
+
+
+def rotated_journal_paths(path):
+    """Returns (generation, path) of every rotated journal of `path`, oldest first."""
+
+    prefix = path + JOURNAL_SUFFIX + '.'
+    rotated = []
+    for journal_path in glob.glob(glob.escape(prefix) + '*'):
+        generation = journal_path[len(prefix):]
+        if generation.isdigit():
+            rotated.append((int(generation), journal_path))
+
+    return sorted(rotated)
+
+
+def read_edit_journal(journal_path):
+    """Returns the base file identities in the header of a journal (None if it has no header) and its records."""
+
+    with open(journal_path, 'rb') as f:
+        data = f.read()
+
+    base_identities = None
+    if data[:len(HEADER_MAGIC)] == HEADER_MAGIC and len(data) >= header_dtype.itemsize:
+        header = np.frombuffer(data[:header_dtype.itemsize], dtype=header_dtype)[0]
+        base_identities = [tuple(int(value) for value in identity) for identity in header['base_identities']
+                           if identity[0] >= 0]
+        data = data[header_dtype.itemsize:]
+    complete_length = len(data) - len(data) % record_dtype.itemsize
+
+    return base_identities, np.frombuffer(data[:complete_length], dtype=record_dtype)
+
+
+def replay_edit_journals(path, compiled_range_dict):
+    """Replays the journals of `path` onto `compiled_range_dict`, removing those that don't belong to the base file."""
+
+    identity = base_file_identity(path)
+    num_spots = len(compiled_range_dict.flat_ranges)
+    journal_paths = [journal_path for _, journal_path in rotated_journal_paths(path)] + [path + JOURNAL_SUFFIX]
+    for journal_path in journal_paths:
+        if os.path.exists(journal_path):
+            base_identities, records = read_edit_journal(journal_path)
+            if base_identities is not None and identity not in base_identities:
+                remove_journal(journal_path)
+                continue
+            if len(records) > 0 and (records['flat_index'].max() >= num_spots or records['hand_id'].max() >= 13 * 13):
+                remove_journal(journal_path)
+                continue
+            if len(records) > 0:
+                compiled_range_dict.set_cells(compiled_range_dict.canonical_flat_indices(records['flat_index']),
+                                              records['hand_id'], records['value'])
+
+
+def remove_journal(journal_path):
+
+    try:
+        os.remove(journal_path)
+    except FileNotFoundError:
+        pass
+
+
+def remove_rotated_journals(path, up_to_generation):
+
+    for generation, journal_path in rotated_journal_paths(path):
+        if generation <= up_to_generation:
+            remove_journal(journal_path)
+
+
+def remove_edit_journals(path):
+
+    remove_rotated_journals(path, float('inf'))
+    remove_journal(path + JOURNAL_SUFFIX)
+
+
+class EditJournal:
+
+    def __init__(self, path):
+
+        self.path = path
+        self.journal_path = path + JOURNAL_SUFFIX
+        self.__pending_records = []
+        # Flushes run on the UI thread, `set_base_identities` on the thread that saves the base file.
+        self.__lock = threading.RLock()
+
+    def record(self, flat_index, hand_id, value):
+
+        self.__pending_records.append((flat_index, hand_id, value))
+
+    def record_many(self, flat_index, hand_ids, values):
+
+        self.__pending_records.extend((flat_index, hand_id, value)
+                                      for hand_id, value in zip(np.asarray(hand_ids).tolist(),
+                                                                np.asarray(values).tolist()))
+
+    def flush(self):
+
+        if len(self.__pending_records) == 0:
+            return
+
+        records = np.array(self.__pending_records, dtype=record_dtype)
+        with self.__lock:
+            with open(self.journal_path, 'ab') as f:
+                if f.tell() == 0:
+                    f.write(journal_header([base_file_identity(self.path)]))
+                f.write(records.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+        self.__pending_records = []
+
+    def set_base_identities(self, base_identities):
+        """Rewrites the header of the journal, if it exists, to match the base files with these identities."""
+
+        with self.__lock:
+            if os.path.exists(self.journal_path):
+                with open(self.journal_path, 'r+b') as f:
+                    f.write(journal_header(base_identities))
+                    f.flush()
+                    os.fsync(f.fileno())
+
+    def discard(self):
+        """Drops the edits not flushed yet and removes the journals."""
+
+        with self.__lock:
+            self.__pending_records = []
+            remove_edit_journals(self.path)
+
+    def rotate(self):
+        """Flushes and moves the journal aside. Returns the generation that covers every edit recorded so far."""
+
+        with self.__lock:
+            self.flush()
+            rotated = rotated_journal_paths(self.path)
+            generation = rotated[-1][0] + 1 if len(rotated) > 0 else 0
+            if os.path.exists(self.journal_path):
+                os.replace(self.journal_path, '{}.{}'.format(self.journal_path, generation))
+
+        return generation
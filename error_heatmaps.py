@@ -0,0 +1,207 @@
+"""Per-spot counts of quiz answers and mistakes, for error-rate heatmaps.
+
+Each spot of each range dict has a (2, 169) counter array: the number of answers and the number of wrong answers for
+every hand. The same counts are also summed per label choice (e.g. every spot with Position 'BN'), so that aggregate
+heatmaps don't need a pass over the spots. Recording an answer updates both in O(1).
+
+Spot indices are padded with 0 below a leaf that is shallower than the full schema, so only the labels down to the
+leaf depth are summed. Counts replayed without a leaf depth (from the answer history, which doesn't store it) are only
+summed once the depth is known, see `resolve_leaf_depths`.
+
+The counters are snapshotted to an .npz file as one (spots, 2, 169) array, which is loaded back as it is, with the
+choice sums computed in numpy. Along with the answer history they are kept in step with, they can also be rebuilt from
+the history's per-hand counts (see `AnswerHistory.hand_counts`).
+"""
+import json
+from collections import defaultdict
+
+import numpy as np
+
+from range_pack import write_atomically
+
+
+ANSWERS = 0
+ERRORS = 1
+
+
+class ErrorHeatmaps:
+
+    def __init__(self):
+
+        # (range dict, spot indices) -> counts
+        self.__spot_counts = {}
+        # (range dict, label axis, choice index) -> counts summed over the spots with that choice
+        self.__choice_counts = defaultdict(lambda: np.zeros((2, 13 * 13), dtype=np.int64))
+        # (range dict, spot indices) -> leaf depth, for the spots whose counts are summed into the choice counts
+        self.__leaf_depths = {}
+        # range dict -> spot indices whose leaf depth isn't known yet
+        self.__unresolved_spots = defaultdict(set)
+        self.num_answers = 0
+
+    def record(self, range_dict_key, spot_indices, hand_id, is_correct, count=1, leaf_depth=None):
+
+        spot_indices = tuple(spot_indices)
+        counts = self.__spot_counts.get((range_dict_key, spot_indices))
+        if counts is None:
+            counts = self.__spot_counts[(range_dict_key, spot_indices)] = np.zeros((2, 13 * 13), dtype=np.int64)
+        if leaf_depth is not None and (range_dict_key, spot_indices) not in self.__leaf_depths:
+            self.__resolve_leaf_depth(range_dict_key, spot_indices, leaf_depth)
+        num_errors = 0 if is_correct else count
+
+        counts[ANSWERS, hand_id] += count
+        counts[ERRORS, hand_id] += num_errors
+        leaf_depth = self.__leaf_depths.get((range_dict_key, spot_indices))
+        if leaf_depth is None:
+            self.__unresolved_spots[range_dict_key].add(spot_indices)
+        else:
+            for axis, choice_index in enumerate(spot_indices[:leaf_depth]):
+                choice_counts = self.__choice_counts[(range_dict_key, axis, choice_index)]
+                choice_counts[ANSWERS, hand_id] += count
+                choice_counts[ERRORS, hand_id] += num_errors
+        self.num_answers += count
+
+    def resolve_leaf_depths(self, range_dict_key, leaf_depth):
+        """Sums the spots of a range dict recorded without a leaf depth into the choice counts.
+
+        `leaf_depth` is a function returning the leaf depth of a spot's indices.
+        """
+
+        for spot_indices in self.__unresolved_spots.pop(range_dict_key, ()):
+            self.__resolve_leaf_depth(range_dict_key, spot_indices, leaf_depth(spot_indices))
+
+    def __resolve_leaf_depth(self, range_dict_key, spot_indices, leaf_depth):
+
+        self.__leaf_depths[(range_dict_key, spot_indices)] = leaf_depth
+        self.__unresolved_spots.get(range_dict_key, set()).discard(spot_indices)
+        counts = self.__spot_counts[(range_dict_key, spot_indices)]
+        for axis, choice_index in enumerate(spot_indices[:leaf_depth]):
+            self.__choice_counts[(range_dict_key, axis, choice_index)] += counts
+
+    def spot_counts(self, range_dict_key, spot_indices):
+        """Returns the number of answers and of wrong answers for each hand of a spot, as two 13x13 arrays."""
+
+        counts = self.__spot_counts.get((range_dict_key, tuple(spot_indices)))
+        if counts is None:
+            counts = np.zeros((2, 13 * 13), dtype=np.int64)
+
+        return counts[ANSWERS].reshape((13, 13)), counts[ERRORS].reshape((13, 13))
+
+    def choice_counts(self, range_dict_key, axis, choice_index):
+        """Like `spot_counts`, summed over all spots below `axis` whose index along it is `choice_index`."""
+
+        counts = self.__choice_counts.get((range_dict_key, axis, choice_index))
+        if counts is None:
+            counts = np.zeros((2, 13 * 13), dtype=np.int64)
+
+        return counts[ANSWERS].reshape((13, 13)), counts[ERRORS].reshape((13, 13))
+
+    def spot_error_rates(self, range_dict_key, spot_indices):
+        """Returns the error rate of each hand of a spot as a 13x13 array, NaN where a hand has no answers."""
+
+        return error_rates(*self.spot_counts(range_dict_key, spot_indices))
+
+    def choice_error_rates(self, range_dict_key, axis, choice_index):
+
+        return error_rates(*self.choice_counts(range_dict_key, axis, choice_index))
+
+    def arrays(self):
+        """Returns a (range dict, spot indices, leaf depth) key for every spot, and their counts as one array."""
+
+        keys = [(range_dict_key, spot_indices, self.__leaf_depths.get((range_dict_key, spot_indices)))
+                for range_dict_key, spot_indices in self.__spot_counts.keys()]
+        counts = np.stack(list(self.__spot_counts.values())) if keys else np.zeros((0, 2, 13 * 13), dtype=np.int64)
+
+        return keys, counts
+
+    def save(self, path):
+
+        save_snapshot(path, *self.arrays())
+
+    @classmethod
+    def from_arrays(cls, keys, counts):
+        """Builds the counters from keys and counts like those of `arrays`, with one numpy sum for each choice."""
+
+        error_heatmaps = cls()
+        counts = np.array(counts, dtype=np.int64)
+
+        choice_rows = defaultdict(list)
+        for row_i, (range_dict_key, spot_indices, leaf_depth) in enumerate(keys):
+            spot_indices = tuple(spot_indices)
+            error_heatmaps.__spot_counts[(range_dict_key, spot_indices)] = counts[row_i]
+            if leaf_depth is None:
+                error_heatmaps.__unresolved_spots[range_dict_key].add(spot_indices)
+                continue
+            error_heatmaps.__leaf_depths[(range_dict_key, spot_indices)] = leaf_depth
+            for axis, choice_index in enumerate(spot_indices[:leaf_depth]):
+                choice_rows[(range_dict_key, axis, choice_index)].append(row_i)
+        for choice, rows in choice_rows.items():
+            error_heatmaps.__choice_counts[choice] = counts[rows].sum(axis=0)
+        error_heatmaps.num_answers = int(counts[:, ANSWERS].sum())
+
+        return error_heatmaps
+
+    def add(self, other):
+        """Adds the counts of another ErrorHeatmaps to these, in O(number of spots of `other`)."""
+
+        other_keys, other_counts = other.arrays()
+        for (range_dict_key, spot_indices, leaf_depth), spot_counts in zip(other_keys, other_counts):
+            counts = self.__spot_counts.get((range_dict_key, spot_indices))
+            if counts is None:
+                counts = self.__spot_counts[(range_dict_key, spot_indices)] = np.zeros((2, 13 * 13), dtype=np.int64)
+            if leaf_depth is not None and (range_dict_key, spot_indices) not in self.__leaf_depths:
+                self.__resolve_leaf_depth(range_dict_key, spot_indices, leaf_depth)
+
+            counts += spot_counts
+            leaf_depth = self.__leaf_depths.get((range_dict_key, spot_indices))
+            if leaf_depth is None:
+                self.__unresolved_spots[range_dict_key].add(spot_indices)
+            else:
+                for axis, choice_index in enumerate(spot_indices[:leaf_depth]):
+                    self.__choice_counts[(range_dict_key, axis, choice_index)] += spot_counts
+            self.num_answers += int(spot_counts[ANSWERS].sum())
+
+    @classmethod
+    def load(cls, path):
+
+        with np.load(path) as snapshot:
+            keys = json.loads(str(snapshot['keys']))
+            counts = snapshot['counts']
+        # Snapshots from before leaf depths were saved have none.
+        keys = [(key[0], tuple(key[1]), key[2] if len(key) > 2 else None) for key in keys]
+
+        return cls.from_arrays(keys, counts)
+
+    @classmethod
+    def from_hand_counts(cls, hand_counts):
+        """Builds the counters from (range dict, spot indices, hand id, number of answers, number correct) rows."""
+
+        spot_rows = {}
+        row_indices = []
+        hand_ids = []
+        num_answers = []
+        num_correct = []
+        for range_dict_key, spot_indices, hand_id, hand_num_answers, hand_num_correct in hand_counts:
+            row_indices.append(spot_rows.setdefault((range_dict_key, tuple(spot_indices)), len(spot_rows)))
+            hand_ids.append(hand_id)
+            num_answers.append(hand_num_answers)
+            num_correct.append(hand_num_correct)
+
+        counts = np.zeros((len(spot_rows), 2, 13 * 13), dtype=np.int64)
+        counts[row_indices, ANSWERS, hand_ids] = num_answers
+        counts[row_indices, ERRORS, hand_ids] = np.subtract(num_answers, num_correct, dtype=np.int64)
+
+        return cls.from_arrays([(range_dict_key, spot_indices, None) for range_dict_key, spot_indices in spot_rows],
+                               counts)
+
+
+def save_snapshot(path, keys, counts):
+    """Writes the keys and counts of `ErrorHeatmaps.arrays` to an .npz file."""
+
+    keys = [[range_dict_key, list(spot_indices), leaf_depth] for range_dict_key, spot_indices, leaf_depth in keys]
+    write_atomically(path, lambda f: np.savez(f, keys=np.array(json.dumps(keys)), counts=counts))
+
+
+def error_rates(num_answers, num_errors):
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(num_answers > 0, num_errors / num_answers, np.nan)
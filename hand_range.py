@@ -0,0 +1,147 @@
+import numpy as np
+
+
+NUM_HANDS = 13 * 13
+NUM_BYTES = (NUM_HANDS + 7) // 8
+
+
+class HandRange:
+    """An immutable range of the 169 starting hands, packed into the bits of a single int.
+
+    Bit k is set if the hand at flat grid index k (see `to_list_index` in view.py) is in the range.
+    """
+
+    __slots__ = ('bits',)
+
+    FULL_BITS = (1 << NUM_HANDS) - 1
+
+    def __init__(self, bits=0):
+
+        self.bits = bits & HandRange.FULL_BITS
+
+    @classmethod
+    def from_array(cls, hand_range):
+
+        packed = np.packbits(np.asarray(hand_range, dtype=bool).ravel(), bitorder='little')
+        return cls(int.from_bytes(packed.tobytes(), 'little'))
+
+    @classmethod
+    def from_hand_ids(cls, hand_ids):
+
+        bits = 0
+        for hand_id in hand_ids:
+            bits |= 1 << int(hand_id)
+
+        return cls(bits)
+
+    @classmethod
+    def full(cls):
+
+        return cls(HandRange.FULL_BITS)
+
+    def to_array(self):
+
+        packed = np.frombuffer(self.bits.to_bytes(NUM_BYTES, 'little'), dtype=np.uint8)
+        return np.unpackbits(packed, count=NUM_HANDS, bitorder='little').astype(bool).reshape((13, 13))
+
+    def __array__(self, dtype=None, copy=None):
+
+        array = self.to_array()
+        return array if dtype is None else array.astype(dtype)
+
+    def __getitem__(self, indices):
+
+        row_i, col_i = indices
+        return bool((self.bits >> (row_i * 13 + col_i)) & 1)
+
+    def __contains__(self, indices):
+
+        return self[indices]
+
+    def __or__(self, other):
+
+        return HandRange(self.bits | other.bits)
+
+    def __and__(self, other):
+
+        return HandRange(self.bits & other.bits)
+
+    def __xor__(self, other):
+
+        return HandRange(self.bits ^ other.bits)
+
+    def __sub__(self, other):
+
+        return HandRange(self.bits & ~other.bits)
+
+    def __invert__(self):
+
+        return HandRange(self.bits ^ HandRange.FULL_BITS)
+
+    def __len__(self):
+
+        return self.bits.bit_count()
+
+    def __bool__(self):
+
+        return self.bits != 0
+
+    def __eq__(self, other):
+
+        return isinstance(other, HandRange) and self.bits == other.bits
+
+    def __hash__(self):
+
+        return hash(self.bits)
+
+    def __repr__(self):
+
+        return 'HandRange({:#x})'.format(self.bits)
+
+
+def as_hand_range(hand_range):
+
+    if isinstance(hand_range, HandRange):
+        return hand_range
+
+    return HandRange.from_array(hand_range)
+
+
+def marginal_mask(hand_ranges):
+    """Marks the hands whose value differs from at least one diagonal neighbour.
+
+    Works on a single 13x13 range or on any stack of them (shape (..., 13, 13)) in one pass.
+    """
+
+    hand_ranges = np.asarray(hand_ranges, dtype=bool)
+    mask = np.zeros(hand_ranges.shape, dtype=bool)
+
+    diagonal_differs = hand_ranges[..., 1:, 1:] != hand_ranges[..., :-1, :-1]
+    mask[..., 1:, 1:] |= diagonal_differs
+    mask[..., :-1, :-1] |= diagonal_differs
+
+    anti_diagonal_differs = hand_ranges[..., 1:, :-1] != hand_ranges[..., :-1, 1:]
+    mask[..., 1:, :-1] |= anti_diagonal_differs
+    mask[..., :-1, 1:] |= anti_diagonal_differs
+
+    return mask
+
+
+def indices_to_hand_str(i, j):
+
+    card_ranks = 'AKQJT98765432'
+
+    if i < j:
+        rank1 = card_ranks[i]
+        rank2 = card_ranks[j]
+        suited_str = 's'
+    elif i > j:
+        rank1 = card_ranks[j]
+        rank2 = card_ranks[i]
+        suited_str = 'o'
+    else:
+        rank1 = card_ranks[i]
+        rank2 = card_ranks[j]
+        suited_str = ''
+
+    return '{}{}{}'.format(rank1, rank2, suited_str)
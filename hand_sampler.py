@@ -0,0 +1,113 @@
+"""Draws quiz hands in proportion to how often they are dealt.
+
+A pair can be dealt in 6 ways, a suited hand in 4 and an offsuit hand in 12. Hands are drawn from Walker alias tables
+over these combo counts, so each draw takes constant time. A draw may be restricted to a mask of hands (e.g. the
+marginal hands of a spot). The table for each mask is built once and cached.
+"""
+import random
+from collections import OrderedDict
+
+import numpy as np
+
+from hand_range import NUM_HANDS
+
+
+def combo_counts():
+    """Returns the number of combos of each hand as a 13x13 array, laid out like the hand grid."""
+
+    row_indices, col_indices = np.indices((13, 13))
+    counts = np.where(row_indices < col_indices, 4, 12)
+    counts[row_indices == col_indices] = 6
+
+    return counts
+
+
+COMBO_COUNTS = combo_counts()
+
+
+class AliasTable:
+    """Walker's alias method over the flat hand ids with a positive weight."""
+
+    def __init__(self, weights):
+
+        weights = np.asarray(weights, dtype=np.float64).ravel()
+        self.hand_ids = np.flatnonzero(weights > 0)
+        if len(self.hand_ids) == 0:
+            raise ValueError('Cannot sample from an empty range.')
+
+        num_outcomes = len(self.hand_ids)
+        scaled = weights[self.hand_ids] * num_outcomes / weights[self.hand_ids].sum()
+        self.probabilities = np.ones(num_outcomes)
+        self.aliases = np.arange(num_outcomes)
+
+        small = [i for i in range(num_outcomes) if scaled[i] < 1]
+        large = [i for i in range(num_outcomes) if scaled[i] >= 1]
+        while small and large:
+            small_i = small.pop()
+            large_i = large.pop()
+            self.probabilities[small_i] = scaled[small_i]
+            self.aliases[small_i] = large_i
+            scaled[large_i] -= 1 - scaled[small_i]
+            if scaled[large_i] < 1:
+                small.append(large_i)
+            else:
+                large.append(large_i)
+
+        # Plain lists make single draws cheaper than indexing numpy arrays.
+        self.__hand_ids = self.hand_ids.tolist()
+        self.__probabilities = self.probabilities.tolist()
+        self.__aliases = self.aliases.tolist()
+
+    def draw(self, rng=random):
+
+        i = rng.randrange(len(self.__hand_ids))
+        if rng.random() >= self.__probabilities[i]:
+            i = self.__aliases[i]
+
+        return self.__hand_ids[i]
+
+    def draw_many(self, num_draws, generator=None):
+
+        if generator is None:
+            generator = np.random.default_rng()
+
+        i = generator.integers(len(self.hand_ids), size=num_draws)
+        use_alias = generator.random(num_draws) >= self.probabilities[i]
+        i[use_alias] = self.aliases[i[use_alias]]
+
+        return self.hand_ids[i]
+
+
+class HandSampler:
+
+    def __init__(self, weights=COMBO_COUNTS, cache_size=1024):
+
+        self.weights = np.asarray(weights, dtype=np.float64).reshape(NUM_HANDS)
+        self.cache_size = cache_size
+        self.__tables = OrderedDict()
+
+    def table(self, mask=None):
+        """Returns the alias table for the hands in `mask` (a HandRange, or None for all hands)."""
+
+        if mask in self.__tables:
+            self.__tables.move_to_end(mask)
+            return self.__tables[mask]
+
+        weights = self.weights if mask is None else self.weights * mask.to_array().ravel()
+        table = AliasTable(weights)
+        self.__tables[mask] = table
+        if len(self.__tables) > self.cache_size:
+            self.__tables.popitem(last=False)
+
+        return table
+
+    def draw(self, mask=None, rng=random):
+
+        return divmod(self.table(mask).draw(rng), 13)
+
+    def draw_many(self, num_draws, mask=None, generator=None):
+        """Draws `num_draws` hands at once. Returns their (row_i, col_i) indices as a (num_draws, 2) array."""
+
+        hand_ids = self.table(mask).draw_many(num_draws, generator)
+
+        return np.stack(np.divmod(hand_ids, 13), axis=1)
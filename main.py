@@ -1,14 +1,65 @@
 import sys
+import time
 
+startup_time = time.perf_counter()
+
+from PySide2.QtCore import QTimer, Qt
 from PySide2.QtWidgets import QApplication
 
+import tracing
 from controller import Controller
 from model import Model
+from startup_profile import FirstPaintFilter, StartupProfile
 from view import View
 
+profile = StartupProfile(startup_time, enabled='--profile-startup' in sys.argv[1:])
+profile.mark('imports')
+
+trace_path = tracing.trace_path_from_environment()
+if trace_path is not None:
+    tracer = tracing.Tracer()
+    tracing.install(tracer)
+
 app = QApplication()
-model = Model()
+profile.mark('QApplication')
+# The window is shown first, with the initial range dict loading on a worker thread.
+model = Model(load_initial_range_dict=False)
+profile.mark('Model')
 view = View(model)
+profile.mark('View')
 controller = Controller(model, view)
+profile.mark('Controller')
+app.aboutToQuit.connect(model.flush_edit_journal)
+if model.answer_history is not None:
+    app.aboutToQuit.connect(model.answer_history.close)
+
+
+def save_snapshots():
+
+    for future in model.save_snapshots():
+        future.result()
+
+
+app.aboutToQuit.connect(save_snapshots)
+if trace_path is not None:
+    stall_monitor = tracing.EventLoopStallMonitor(tracer)
+    stall_monitor.start()
+    app.aboutToQuit.connect(lambda: tracer.write_chrome_trace(trace_path))
+if profile.enabled:
+    first_paint_filter = FirstPaintFilter(view.hand_grid_widget, lambda: profile.mark('first paint'))
+
+    def finish_startup_profile(index):
+
+        if index == model.current_range_dict_list_index:
+            profile.finish('initial range dict')
+
+    # Queued after the Controller's own slot, so this runs once the range dict is displayed.
+    controller.range_dict_load_signals.loaded.connect(finish_startup_profile, Qt.QueuedConnection)
+controller.load_initial_range_dict()
 view.window.show()
-sys.exit(app.exec_())
\ No newline at end of file
+profile.mark('show')
+# Fill the range dict cache and read the saved error heatmaps and review state in the background once the event loop has
+# painted the window.
+QTimer.singleShot(0, controller.preload_range_dicts)
+QTimer.singleShot(0, controller.load_saved_state)
+sys.exit(app.exec_())
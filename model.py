@@ -1,23 +1,72 @@
 import os
-from collections import OrderedDict
-import itertools
-import functools
+import logging
+import sqlite3
+from collections import OrderedDict, defaultdict
+import random
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
-import pickle
 import json
 
+from answer_history import open_answer_history
+from answer_table import AnswerTable
+from compiled_range_dict import CompiledRangeDict
+from error_heatmaps import ErrorHeatmaps, save_snapshot
+from edit_journal import EditJournal, base_file_identity, remove_edit_journals, remove_rotated_journals
+from hand_range import HandRange, marginal_mask
+from hand_sampler import AliasTable
+from range_dict_cache import RangeDictCache
+from range_expression import RangeExpressionParser
+from range_pack import save_range_dict_file, write_atomically
+from spaced_repetition import ReviewItem, SpacedRepetitionScheduler, save_review_state
+
+
+logger = logging.getLogger(__name__)
+
 
 class Model:
 
-    def __init__(self, range_dict_list_filepath=os.path.join(os.getcwd(), 'range_dicts', 'range_dict_list.json')):
+    def __init__(self, range_dict_list_filepath=os.path.join(os.getcwd(), 'range_dicts', 'range_dict_list.json'),
+                 range_dict_cache_budget=256 * 1024 * 1024,
+                 answer_history_filepath=os.path.join(os.getcwd(), 'answer_history.sqlite3'),
+                 error_heatmaps_filepath=os.path.join(os.getcwd(), 'error_heatmaps.npz'),
+                 review_state_filepath=os.path.join(os.getcwd(), 'review_state.npz'),
+                 load_initial_range_dict=True):
 
         self.range_dict_list_filepath = range_dict_list_filepath
+        # Every quiz answer is recorded here, unless `answer_history_filepath` is None or can't be opened.
+        self.answer_history = (open_answer_history(answer_history_filepath) if answer_history_filepath is not None
+                               else None)
+        self.error_heatmaps_filepath = error_heatmaps_filepath
+        # Counts the answers of this session, until the saved counters are added (see `load_error_heatmaps`).
+        self.__error_heatmaps = ErrorHeatmaps()
+        self.__error_heatmaps_future = None
+        self.error_heatmaps_loaded = error_heatmaps_filepath is None and self.answer_history is None
+        self.__saved_num_answers = None
+        # Spaced repetition state. Answers recorded while the saved state is loading (see `load_review_state`) are
+        # logged, to be recorded again on top of it.
+        self.review_state_filepath = review_state_filepath
+        self.review_state_loaded = review_state_filepath is None and self.answer_history is None
+        self.review_scheduler = SpacedRepetitionScheduler()
+        self.__review_state_future = None
+        self.__saved_review_state = None
+        self.range_dict_cache = RangeDictCache(range_dict_cache_budget)
+        self.__preload_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='range_dict_preload')
+        self.__preload_futures = {}
+        # Saves are compacted into the base file one at a time, in order. Error heatmap snapshots are written here too.
+        self.__save_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='range_dict_save')
+        self.__edit_journal = None
         with open(self.range_dict_list_filepath, 'r') as f:
             self.range_dict_list = json.load(f)
         self.current_range_dict_list_index = 0
-        self.load_range_dict()
         self.editing_mode = False
+        self.__compiled_range_dict = None
 
+        # Without the initial range dict, the schema is empty until the caller loads one (e.g. off the UI thread with
+        # `preload_range_dict`, then `load_range_dict`).
+        if load_initial_range_dict:
+            self.load_range_dict()
+        else:
+            self.range_dict_schema = OrderedDict()
         self.check_default_radio_buttons()
 
         self.range_entered = np.zeros((13, 13), dtype=bool)
@@ -25,12 +74,14 @@ class Model:
         self.incorrectly_left_unchecked = np.zeros((13, 13), dtype=bool)
         self.correctly_checked = np.zeros((13, 13), dtype=bool)
         self.copied_range = None
+        self.range_expression_parser = RangeExpressionParser()
 
         self.card_ranks = 'AKQJT98765432'
 
         # Hand quiz stuff
         self.randomize_range_in_hand_quiz = False
         self.hand_quiz_marginal_hands_only = True
+        self.hand_quiz_spaced_repetition = True
         self.hand_quiz_hand_indices = (0, 0)
         # TODO: Hardwired dicts for testing. Make flexible.
         self.hand_quiz_answer_dict = answers_dict
@@ -38,47 +89,122 @@ class Model:
         self.alternative_actions_dict = alternatives_dict
         self.action_to_quiz_option_dict = action_to_quiz_option_dict
 
+    @property
+    def range_dict_loaded(self):
+        """Whether a range dict has been loaded. Until then the schema is empty and there is no current spot."""
+
+        return self.__compiled_range_dict is not None
+
     @property
     def reference_range(self):
 
-        range_dict = self.__reference_range_dict
-        for label in self.range_dict_schema.keys():
-            key = self.current_radio_button_setting[label]
-            if type(range_dict[key]) is dict:
-                range_dict = range_dict[key]
-            else:
-                return range_dict[key]
+        return self.__compiled_range_dict.range_at(self.current_radio_button_indices)
 
     def set_radio_button_setting(self, label_index_dict):
 
         self.current_radio_button_setting = {label: self.range_dict_schema[label][index]
                                              for label, index in label_index_dict.items()}
+        self.current_radio_button_indices = self.__compiled_range_dict.indices(self.current_radio_button_setting)
+
+    def set_applicable_radio_button_setting(self, label_index_dict):
+        """Like `set_radio_button_setting`, with each choice that isn't applicable, given the choices above it, replaced
+        by the first one that is."""
+
+        self.set_radio_button_setting(label_index_dict)
+        applicable_indices = self.__compiled_range_dict.applicable_spot_indices(self.current_radio_button_indices)
+        if applicable_indices != self.current_radio_button_indices:
+            self.set_radio_button_setting(OrderedDict(zip(self.range_dict_schema.keys(), applicable_indices)))
+
+    @property
+    def current_spot_indices(self):
+        """The indices of the current spot's leaf, with 0 for the labels below a leaf above the full schema depth."""
+
+        flat_index = self.__compiled_range_dict.flat_index(self.current_radio_button_indices)
+
+        return tuple(int(index) for index in np.unravel_index(flat_index, self.__compiled_range_dict.shape))
+
+    def leaf_depth(self, spot_indices):
+        """The number of labels down to the leaf of the spot at `spot_indices`."""
+
+        return len(self.__compiled_range_dict.applicable_nodes(spot_indices))
+
+    @property
+    def range_dict_key(self):
+
+        return self.range_dict_list[self.current_range_dict_list_index]['Name']
 
     @property
     def applicable_radio_buttons(self):
 
         applicable_dict = {label: [] for label in self.range_dict_schema.keys()}
 
-        range_dict = self.__reference_range_dict
-        for i, label in enumerate(self.range_dict_schema.keys()):
+        applicable_nodes = self.__compiled_range_dict.applicable_nodes(self.current_radio_button_indices)
+        for i, (label, node) in enumerate(zip(self.range_dict_schema.keys(), applicable_nodes)):
             if i == 0:
                 applicable_dict[label] = self.range_dict_schema[label]
             else:
-                applicable_dict[label] = list(range_dict.keys())
-            key = self.current_radio_button_setting[label]
-            if key not in list(range_dict.keys()):
-                key = list(range_dict.keys())[0]
-            if type(range_dict[key]) is dict:
-                range_dict = range_dict[key]
-            else:
-                break
+                applicable_dict[label] = [self.range_dict_schema[label][index] for index in node.child_indices]
 
         return applicable_dict
 
+    @property
+    def applicable_radio_button_masks(self):
+        """Like `applicable_radio_buttons`, as a bitmask of the applicable button ids of each radio button group.
+
+        Also returns the id of the button to check in each group whose checked button isn't applicable.
+        """
+
+        masks = [0] * len(self.range_dict_schema)
+        default_ids = [0] * len(self.range_dict_schema)
+
+        applicable_nodes = self.__compiled_range_dict.applicable_nodes(self.current_radio_button_indices)
+        for i, node in enumerate(applicable_nodes):
+            masks[i] = node.mask
+            default_ids[i] = node.default_index
+        if applicable_nodes:
+            masks[0] = (1 << self.__compiled_range_dict.shape[0]) - 1
+            default_ids[0] = 0
+
+        return masks, default_ids
+
+    @property
+    def spot_prefixes(self):
+        """The index prefix of every spot (leaf) of the range dict, in the order of the original dict."""
+
+        if self.__spot_prefixes is None:
+            self.__spot_prefixes = list(self.__compiled_range_dict.leaf_prefixes())
+
+        return self.__spot_prefixes
+
+    def set_spot_weights(self, weights):
+        """Weights the spots `random_radio_button_setting` picks, one weight per entry of `spot_prefixes`.
+
+        The weights apply until the next range dict is loaded. None picks the spots uniformly again.
+        """
+
+        self.__spot_alias_table = AliasTable(weights) if weights is not None else None
+
+    def random_radio_button_setting(self, rng=random):
+        """Picks a spot of the range dict at random: uniformly, or by the weights given to `set_spot_weights`.
+
+        Returns a label -> index dict for `set_radio_button_setting`. Groups below the spot's leaf keep their current
+        choice.
+        """
+
+        spot_prefixes = self.spot_prefixes
+        if self.__spot_alias_table is None:
+            prefix = spot_prefixes[rng.randrange(len(spot_prefixes))]
+        else:
+            prefix = spot_prefixes[self.__spot_alias_table.draw(rng)]
+        indices = prefix + tuple(self.current_radio_button_indices[len(prefix):])
+
+        return OrderedDict(zip(self.range_dict_schema.keys(), indices))
+
     def check_default_radio_buttons(self):
 
         self.current_radio_button_setting = OrderedDict([(label, self.range_dict_schema[label][0])
                                                          for label in self.range_dict_schema.keys()])
+        self.current_radio_button_indices = (0,) * len(self.range_dict_schema)
 
     # TODO: This will need to change
     # def create_new_empty_reference_range_dict(self):
@@ -99,74 +225,336 @@ class Model:
 
         range_dict_descriptor = self.range_dict_list[self.current_range_dict_list_index]
         if range_dict_descriptor['Filepath'] is not None:
-            with open(range_dict_descriptor['Filepath'], 'rb') as f:
-                self.__top_level_dict = pickle.load(f)
-            self.range_dict_schema = self.__top_level_dict['schema']
-            self.__reference_range_dict = self.__top_level_dict['contents']
+            self.flush_edit_journal()
+            self.__compiled_range_dict = self.range_dict_cache.load(range_dict_descriptor['Filepath'])
+            self.__edit_journal = EditJournal(os.path.abspath(range_dict_descriptor['Filepath']))
+            self.range_dict_schema = self.__compiled_range_dict.schema
+            self.__clear_marginal_hand_cache()
+            self.__answer_table = None
+            self.__spot_prefixes = None
+            self.__spot_alias_table = None
         else:
             # TODO
             pass
             # self.create_new_empty_reference_range_dict()
 
-    def save_range_dict(self, target_path):
+    def range_dict_is_ready(self, range_dict_list_index):
 
-        with open(target_path, 'wb') as f:
-            pickle.dump(self.__top_level_dict, f)
+        filepath = self.range_dict_list[range_dict_list_index]['Filepath']
+
+        return filepath is None or self.range_dict_cache.is_cached(filepath)
+
+    def preload_range_dict(self, range_dict_list_index, callback=None):
+        """Loads a range dict into the cache on a worker thread.
+
+        `callback(range_dict_list_index, exception)` is called on the worker thread once loading has finished, with
+        `exception` set to None on success.
+        """
+
+        filepath = self.range_dict_list[range_dict_list_index]['Filepath']
+        if filepath is None:
+            return None
+
+        future = self.__preload_futures.get(range_dict_list_index)
+        if future is None or (future.done() and not self.range_dict_cache.is_cached(filepath)):
+            future = self.__preload_executor.submit(self.range_dict_cache.load, filepath)
+            self.__preload_futures[range_dict_list_index] = future
+        if callback is not None:
+            future.add_done_callback(lambda f: callback(range_dict_list_index, f.exception()))
+
+        return future
+
+    def preload_range_dicts(self, callback=None):
+
+        for range_dict_list_index in range(len(self.range_dict_list)):
+            if range_dict_list_index != self.current_range_dict_list_index:
+                self.preload_range_dict(range_dict_list_index, callback)
+
+    @property
+    def error_heatmaps(self):
+        """The error heatmap counters. Until `finish_loading_error_heatmaps`, only those of this session."""
+
+        return self.__error_heatmaps
+
+    def load_error_heatmaps(self, callback=None):
+        """Reads the saved error heatmap counters on a worker thread.
+
+        `callback(exception)` is called on the worker thread once they have been read. Then call
+        `finish_loading_error_heatmaps` on the UI thread to add them in.
+        """
+
+        if self.__error_heatmaps_future is None:
+            self.__error_heatmaps_future = self.__preload_executor.submit(self.__read_error_heatmaps)
+        if callback is not None:
+            self.__error_heatmaps_future.add_done_callback(lambda f: callback(f.exception()))
+
+    def finish_loading_error_heatmaps(self):
+
+        if self.error_heatmaps_loaded:
+            return
+        saved_error_heatmaps = self.__error_heatmaps_future.result()
+        saved_error_heatmaps.add(self.__error_heatmaps)
+        self.__error_heatmaps = saved_error_heatmaps
+        self.error_heatmaps_loaded = True
+
+    def __read_error_heatmaps(self):
+
+        error_heatmaps = ErrorHeatmaps()
+        if self.error_heatmaps_filepath is not None and os.path.exists(self.error_heatmaps_filepath):
+            try:
+                error_heatmaps = ErrorHeatmaps.load(self.error_heatmaps_filepath)
+            except (OSError, ValueError, KeyError):
+                logger.exception('Could not load the error heatmaps %s.', self.error_heatmaps_filepath)
+
+        # The snapshot is behind the answer history after a crash, or missing. Rebuild it from the history then. The
+        # answers of this session are left out, they are counted from the start.
+        try:
+            if self.answer_history is not None:
+                up_to_id = self.answer_history.initial_last_id
+                if self.answer_history.count(up_to_id) != error_heatmaps.num_answers:
+                    error_heatmaps = ErrorHeatmaps.from_hand_counts(self.answer_history.hand_counts(up_to_id))
+        except sqlite3.Error:
+            logger.exception('Could not rebuild the error heatmaps from the answer history.')
+
+        return error_heatmaps
+
+    def current_error_rates(self, axis=None):
+        """Error rates of the current spot's hands, or of all spots sharing its choice along `axis` if given."""
+
+        spot_indices = self.current_spot_indices
+        if axis is None:
+            return self.error_heatmaps.spot_error_rates(self.range_dict_key, spot_indices)
+        if axis >= self.leaf_depth(spot_indices):
+            return np.full((13, 13), np.nan)
+
+        self.error_heatmaps.resolve_leaf_depths(self.range_dict_key, self.leaf_depth)
+        return self.error_heatmaps.choice_error_rates(self.range_dict_key, axis, spot_indices[axis])
+
+    def save_error_heatmaps(self):
+        """Snapshots the error heatmap counters on a worker thread, if they changed since the last snapshot.
+
+        Returns the future of the write, or None if there was nothing to save. Until the saved counters have been loaded
+        nothing is saved, as that would overwrite them with the counts of this session.
+        """
+
+        if self.error_heatmaps_filepath is None or not self.error_heatmaps_loaded:
+            return None
+        if self.__error_heatmaps.num_answers == self.__saved_num_answers:
+            return None
+
+        self.__saved_num_answers = self.__error_heatmaps.num_answers
+        keys, counts = self.__error_heatmaps.arrays()
+        return self.__save_executor.submit(save_snapshot, self.error_heatmaps_filepath, keys, counts)
+
+    def load_review_state(self, callback=None):
+        """Reads the saved spaced repetition state on a worker thread, like `load_error_heatmaps`.
+
+        Answers in the history that the snapshot doesn't cover (all of them, without a snapshot) are replayed into it.
+        Then call `finish_loading_review_state` on the UI thread.
+        """
+
+        if self.review_state_loaded:
+            return
+        if self.__review_state_future is None:
+            self.review_scheduler.start_log()
+            self.__review_state_future = self.__preload_executor.submit(self.__read_review_state)
+        if callback is not None:
+            self.__review_state_future.add_done_callback(lambda f: callback(f.exception()))
+
+    def finish_loading_review_state(self):
+
+        if self.review_state_loaded:
+            return
+        self.review_scheduler.restore(self.__review_state_future.result())
+        self.review_state_loaded = True
+
+    def __read_review_state(self):
+
+        scheduler = SpacedRepetitionScheduler()
+        history_last_id = 0
+        if self.review_state_filepath is not None and os.path.exists(self.review_state_filepath):
+            try:
+                scheduler, history_last_id = SpacedRepetitionScheduler.load(self.review_state_filepath)
+            except (OSError, ValueError, KeyError):
+                logger.exception('Could not load the review state %s.', self.review_state_filepath)
+
+        # The snapshot covers the history up to `history_last_id`, and the answers after it up to its last record time.
+        # Anything later (e.g. answers given before a crash) is replayed. The answers of this session are logged.
+        try:
+            if self.answer_history is not None:
+                last_record_time = scheduler.last_record_time
+                for timestamp, range_dict_key, spot_indices, hand_id, is_correct in self.answer_history.answers(
+                        history_last_id, self.answer_history.initial_last_id):
+                    if last_record_time is None or timestamp > last_record_time:
+                        scheduler.record(ReviewItem(range_dict_key, spot_indices, hand_id), is_correct, timestamp)
+        except sqlite3.Error:
+            logger.exception('Could not replay the answer history into the review state.')
+
+        return scheduler
+
+    def save_review_state(self):
+        """Snapshots the spaced repetition state on a worker thread, like `save_error_heatmaps`."""
+
+        if self.review_state_filepath is None or not self.review_state_loaded:
+            return None
+        review_state = (len(self.review_scheduler), self.review_scheduler.last_record_time)
+        if review_state == self.__saved_review_state:
+            return None
+
+        self.__saved_review_state = review_state
+        keys, states = self.review_scheduler.arrays()
+        history_last_id = self.answer_history.initial_last_id if self.answer_history is not None else 0
+        return self.__save_executor.submit(save_review_state, self.review_state_filepath, keys, states, history_last_id,
+                                           self.review_scheduler.last_record_time)
+
+    def save_snapshots(self):
+        """Saves the error heatmaps and the review state if they changed. Returns the futures of the writes."""
+
+        return [future for future in (self.save_error_heatmaps(), self.save_review_state()) if future is not None]
+
+    def flush_edit_journal(self):
+
+        if self.__edit_journal is not None:
+            self.__edit_journal.flush()
+
+    def save_range_dict(self, target_path, callback=None):
+        """Saves the current range dict to `target_path`.
+
+        All edits so far are flushed to the edit journal before this returns. The base file is then rewritten from a
+        snapshot on a background thread, after which `callback(exception)` is called on that thread.
+        """
+
+        target_path = os.path.abspath(target_path)
+        compiled_range_dict = self.__compiled_range_dict
+        source_journal = self.__edit_journal
+
+        generation = source_journal.rotate()
+        edit_count = compiled_range_dict.edit_count
+        snapshot = CompiledRangeDict(compiled_range_dict.to_top_level_dict())
+        if source_journal.path != target_path:
+            remove_edit_journals(target_path)
+            self.__edit_journal = EditJournal(target_path)
+        target_journal = self.__edit_journal
+
+        def match_journal_to_new_file(temp_path):
+            # The live journal holds the edits made since the rotation, which the new file doesn't have. Until the new
+            # file is in place, either file may be there after a crash.
+            target_journal.set_base_identities([base_file_identity(target_path), base_file_identity(temp_path)])
+
+        def compact():
+            save_range_dict_file(target_path, snapshot, match_journal_to_new_file)
+            target_journal.set_base_identities([base_file_identity(target_path)])
+            remove_rotated_journals(source_journal.path, generation)
+            self.range_dict_cache.saved(target_path, compiled_range_dict, edit_count)
+
+        future = self.__save_executor.submit(compact)
+        if callback is not None:
+            future.add_done_callback(lambda f: callback(f.exception()))
+
+        return future
+
+    def revert_range_dict(self):
+        """Discards the unsaved edits of the current range dict and reloads it from its base file."""
+
+        filepath = self.range_dict_list[self.current_range_dict_list_index]['Filepath']
+        if filepath is None:
+            return
+
+        # Let saves in progress finish, so that they don't put back the journals being discarded.
+        self.__save_executor.submit(lambda: None).result()
+        self.__edit_journal.discard()
+        self.__edit_journal = None
+        self.range_dict_cache.discard(filepath)
+        self.load_range_dict()
+
+    @property
+    def range_dict_cache_hits(self):
+
+        return self.range_dict_cache.hits
+
+    @property
+    def range_dict_cache_misses(self):
+
+        return self.range_dict_cache.misses
 
     def save_range_dict_list(self):
 
-        with open(self.range_dict_list_filepath, 'w') as f:
-            json.dump(self.range_dict_list, f, indent=4)
+        write_atomically(self.range_dict_list_filepath, lambda f: json.dump(self.range_dict_list, f, indent=4),
+                         mode='w')
+
+    def __alternative_action_indices(self, alternative_action):
+
+        setting = dict(self.current_radio_button_setting, Action=alternative_action)
+
+        return self.__compiled_range_dict.indices(setting)
 
     def alternative_action_range(self, alternative_action):
 
-        current_hero_pos_setting = self.current_radio_button_setting['Position']
-        current_villain_pos_setting = self.current_radio_button_setting['VS']
+        return self.__compiled_range_dict.range_at(self.__alternative_action_indices(alternative_action))
 
-        hero_pos_action = self.__reference_range_dict[current_hero_pos_setting][alternative_action]
-        if type(hero_pos_action) is not dict:
-            return hero_pos_action
-        else:
-            return hero_pos_action[current_villain_pos_setting]
+    def set_reference_range_cell(self, row_i, col_i, value):
 
-    def range_of_quiz_answer(self, selected_option):
+        flat_index = self.__compiled_range_dict.flat_index(self.current_radio_button_indices)
+        self.__compiled_range_dict.set_cell(flat_index, row_i, col_i, value)
+        self.__edit_journal.record(flat_index, row_i * 13 + col_i, value)
+        self.__reference_range_changed(flat_index)
 
-        if selected_option in {'Fold', 'Check'}:
-            return ValueError('"{}" is not handled by this method.'.format(selected_option))
+    def set_reference_range(self, reference_range):
+        """Sets the current spot's reference range in one edit of the cells that change."""
 
-        current_action_setting = self.current_radio_button_setting['Action']
+        reference_range = np.asarray(reference_range, dtype=bool).ravel()
+        flat_index = self.__compiled_range_dict.flat_index(self.current_radio_button_indices)
+        hand_ids = np.flatnonzero(self.__compiled_range_dict.flat_ranges[flat_index].ravel() != reference_range)
+        if len(hand_ids) == 0:
+            return
+
+        values = reference_range[hand_ids]
+        self.__compiled_range_dict.set_cells(np.full(len(hand_ids), flat_index), hand_ids, values)
+        self.__edit_journal.record_many(flat_index, hand_ids, values)
+        self.__reference_range_changed(flat_index)
+
+    def set_range(self, range_array):
+        """Sets the entered range and, in editing mode, makes it the current spot's reference range."""
 
-        if selected_option in {'3bet', '4bet', 'Limp/fold', 'Limp/call', 'Limp/3bet'}:
-            return self.alternative_action_range(selected_option)
-        elif selected_option == 'Raise':
-            assert current_action_setting in {'RFI', 'Raise vs limp'}
-            return self.reference_range
-        elif selected_option == 'Call':
-            if current_action_setting == '3bet':
-                return self.alternative_action_range('Call RFI')
-            elif current_action_setting == '4bet':
-                return self.alternative_action_range('Call 3bet')
+        self.range_entered[...] = np.asarray(range_array, dtype=bool).reshape((13, 13))
+        if self.editing_mode:
+            self.set_reference_range(self.range_entered)
+
+    def range_from_expression(self, expression):
+        """Returns the hands of a range expression like '22+, A2s+, KTo+' (see range_expression.py) as a 13x13 array.
+
+        Raises RangeExpressionError if the expression can't be parsed.
+        """
+
+        return self.range_expression_parser.parse(expression)
+
+    def set_range_expression(self, expression):
+        """Like `set_range`, with the range given as a range expression."""
+
+        self.set_range(self.range_from_expression(expression))
+
+    def __reference_range_changed(self, flat_index):
+
+        for spot_flat_index in self.__marginal_hand_cache_dependents.pop(flat_index, ()):
+            self.__marginal_hand_cache.pop(spot_flat_index, None)
+        self.__answer_table = None
 
     @property
-    def hand_quiz_correct_action(self):
+    def answer_table(self):
+        """The correct quiz answers of every spot and hand, built on first use after loading or editing."""
 
-        current_action_setting = self.current_radio_button_setting['Action']
+        if self.__answer_table is None:
+            self.__answer_table = AnswerTable(self.__compiled_range_dict, self.alternative_actions_dict)
 
-        if self.reference_range[self.hand_quiz_hand_indices]:
-            return current_action_setting
+        return self.__answer_table
 
-        alternative_actions = self.alternative_actions_dict[current_action_setting]
-        for alternative_action in alternative_actions:
-            alternative_action_range = self.alternative_action_range(alternative_action)
-            if alternative_action_range[self.hand_quiz_hand_indices]:
-                return alternative_action
+    @property
+    def hand_quiz_correct_action(self):
 
-        if current_action_setting == 'Raise vs limp':
-            return 'Check'
-        else:
-            return 'Fold'
+        return self.answer_table.correct_action(self.current_radio_button_indices, self.hand_quiz_hand_indices)
 
-    def translate_quiz_answer(self, selected_option):
+    def translate_quiz_answer(self, selected_option, current_action_setting=None):
+        """Returns the action a quiz option stands for, in a spot with the current (or the given) action."""
 
         if selected_option in self.range_dict_schema['Action']:
             return selected_option
@@ -174,7 +562,8 @@ class Model:
         if selected_option in {'Fold', 'Check'}:
             return selected_option
 
-        current_action_setting = self.current_radio_button_setting['Action']
+        if current_action_setting is None:
+            current_action_setting = self.current_radio_button_setting['Action']
 
         if selected_option == 'Call':
             if current_action_setting in {'Call RFI', '3bet'}:
@@ -194,107 +583,103 @@ class Model:
         # TODO: Must be made more flexible.
         selected_action = self.translate_quiz_answer(selected_option)
 
-        current_action_setting = self.current_radio_button_setting['Action']
-
-        if selected_action == current_action_setting:
-            return self.reference_range[self.hand_quiz_hand_indices]
-        elif selected_action not in {'Fold', 'Check'}:
-            range_of_selected_action = self.alternative_action_range(selected_action)
-            return range_of_selected_action[self.hand_quiz_hand_indices]
-        elif selected_action == 'Check':
-            return not self.reference_range[self.hand_quiz_hand_indices]
-        else:
-            assert selected_action == 'Fold'
-            return not self.combined_alternatives_range[self.hand_quiz_hand_indices]
+        return self.answer_table.is_accepted(self.current_radio_button_indices, self.hand_quiz_hand_indices,
+                                             selected_action)
 
     @property
     def combined_alternatives_range(self):
 
-        current_action_setting = self.current_radio_button_setting['Action']
-        alternative_actions = self.alternative_actions_dict[current_action_setting]
+        # Folding is correct for exactly the hands outside the current action's range and its alternatives' ranges.
+        return ~HandRange.from_array(self.answer_table.accepted_range(self.current_radio_button_indices, 'Fold'))
 
-        if len(alternative_actions) == 0:
-            return self.reference_range
+    def quiz_feedback_range(self, selected_option):
 
-        applicable_actions = alternative_actions + [current_action_setting]
-        alternative_ranges = [self.alternative_action_range(applicable_action)
-                              for applicable_action in applicable_actions]
+        selected_action = self.translate_quiz_answer(selected_option)
 
-        return functools.reduce(np.logical_or, alternative_ranges)
+        return HandRange.from_array(self.answer_table.feedback_range(self.current_radio_button_indices, selected_action))
 
-    def quiz_feedback_range(self, selected_option):
+    def quiz_answers_are_correct(self, spot_indices, hand_ids, selected_options):
+        """Grades many quiz answers at once, like `hand_quiz_answer_is_correct` in each answer's spot.
 
-        if selected_option not in {'Fold', 'Check'}:
-            return self.range_of_quiz_answer(selected_option)
-        elif selected_option == 'Check':
-            return self.reference_range
-        else:
-            return self.combined_alternatives_range
+        `spot_indices` is an (n, number of labels) array of full spot indices, `hand_ids` and `selected_options` have n
+        entries. Each option is translated once per action choice, not once per answer.
+        """
 
-    @property
-    def marginal_index_pairs(self):
+        spot_indices = np.asarray(spot_indices, dtype=np.intp).reshape((-1, len(self.range_dict_schema)))
+        answer_table = self.answer_table
+        action_choices = self.range_dict_schema['Action']
+        options, option_ids = np.unique(np.asarray(selected_options, dtype=object).astype(str), return_inverse=True)
+
+        # The action code of every (action choice, option) pair, -1 where the option doesn't apply.
+        action_codes = np.full((len(action_choices), len(options)), -1, dtype=np.intp)
+        for choice_index, action_choice in enumerate(action_choices):
+            for option_id, option in enumerate(options):
+                try:
+                    action = self.translate_quiz_answer(option, action_choice)
+                except ValueError:
+                    continue
+                action_codes[choice_index, option_id] = answer_table.action_codes[action]
+
+        answer_action_codes = action_codes[spot_indices[:, answer_table.action_axis], option_ids]
+        if (answer_action_codes < 0).any():
+            raise ValueError("I'm not programmed for this :(")
+
+        return answer_table.are_accepted(spot_indices, hand_ids, answer_action_codes)
+
+    def __clear_marginal_hand_cache(self):
+
+        # Flat hand ids (row_i * 13 + col_i) of the marginal hands, keyed by the flat index of the spot.
+        self.__marginal_hand_cache = {}
+        # Flat index of a range -> flat indices of the spots whose cache entries were computed from it.
+        self.__marginal_hand_cache_dependents = defaultdict(set)
+
+    def __marginal_actions(self):
 
-        current_hero_pos_setting = self.current_radio_button_setting['Position']
         current_action_setting = self.current_radio_button_setting['Action']
-        current_villain_pos_setting = self.current_radio_button_setting['VS']
 
         if current_action_setting in {'RFI', 'Raise vs limp'}:
-            return marginal_index_pairs(self.reference_range)
+            return [current_action_setting]
         elif current_action_setting in {'Call RFI', '3bet'}:
-            calling_range = self.__reference_range_dict[current_hero_pos_setting]['Call RFI'][current_villain_pos_setting]
-            three_betting_range = self.__reference_range_dict[current_hero_pos_setting]['3bet'][current_villain_pos_setting]
-            calling_range_marginal = marginal_index_pairs(calling_range)
-            three_betting_range_marginal = marginal_index_pairs(three_betting_range)
-            return list(set(calling_range_marginal + three_betting_range_marginal))
+            return ['Call RFI', '3bet']
         elif current_action_setting in {'Call 3bet', '4bet'}:
-            calling_range = self.__reference_range_dict[current_hero_pos_setting]['Call 3bet'][current_villain_pos_setting]
-            four_betting_range = self.__reference_range_dict[current_hero_pos_setting]['4bet'][current_villain_pos_setting]
-            calling_range_marginal = marginal_index_pairs(calling_range)
-            four_betting_range_marginal = marginal_index_pairs(four_betting_range)
-            return list(set(calling_range_marginal + four_betting_range_marginal))
+            return ['Call 3bet', '4bet']
         elif current_action_setting in {'Limp/fold', 'Limp/call', 'Limp/3bet'}:
-            lf_range = self.__reference_range_dict[current_hero_pos_setting]['Limp/fold'][current_villain_pos_setting]
-            lc_range = self.__reference_range_dict[current_hero_pos_setting]['Limp/call'][current_villain_pos_setting]
-            l3_range = self.__reference_range_dict[current_hero_pos_setting]['Limp/3bet'][current_villain_pos_setting]
-            lf_range_marginal = marginal_index_pairs(lf_range)
-            lc_range_marginal = marginal_index_pairs(lc_range)
-            l3_range_marginal = marginal_index_pairs(l3_range)
-            return list(set(lf_range_marginal + lc_range_marginal + l3_range_marginal))
+            return ['Limp/fold', 'Limp/call', 'Limp/3bet']
         else:
             raise ValueError("I'm not programmed for this :(")
 
+    @property
+    def marginal_hand_ids(self):
+
+        spot_flat_index = self.__compiled_range_dict.flat_index(self.current_radio_button_indices)
+        if spot_flat_index in self.__marginal_hand_cache:
+            return self.__marginal_hand_cache[spot_flat_index]
+
+        action_flat_indices = [self.__compiled_range_dict.flat_index(self.__alternative_action_indices(action))
+                               for action in self.__marginal_actions()]
+        masks = self.__compiled_range_dict.flat_marginal_masks[action_flat_indices]
+        hand_ids = np.flatnonzero(masks.any(axis=0)).astype(np.int16)
+
+        self.__marginal_hand_cache[spot_flat_index] = hand_ids
+        for action_flat_index in action_flat_indices:
+            self.__marginal_hand_cache_dependents[action_flat_index].add(spot_flat_index)
 
-def marginal_index_pairs(hand_range: np.ndarray):
+        return hand_ids
 
-    index_pairs = []
+    @property
+    def marginal_hand_range(self):
 
-    for i in range(13):
-        for j in range(13):
+        return HandRange.from_hand_ids(self.marginal_hand_ids)
 
-            value = hand_range[i, j]
+    @property
+    def marginal_index_pairs(self):
 
-            adjacent_row_indices = []
-            adjacent_column_indices = []
-            if i > 0:
-                adjacent_row_indices.append(i - 1)
-            if i < 12:
-                adjacent_row_indices.append(i + 1)
-            if j > 0:
-                adjacent_column_indices.append(j - 1)
-            if j < 12:
-                adjacent_column_indices.append(j + 1)
-            neighbors = itertools.product(adjacent_row_indices, adjacent_column_indices)
+        return [divmod(hand_id, 13) for hand_id in self.marginal_hand_ids.tolist()]
 
-            is_marginal = False
-            for neighbor in neighbors:
-                if hand_range[neighbor] != value:
-                    is_marginal = True
-                    break
 
-            if is_marginal:
-                index_pairs.append((i, j))
+def marginal_index_pairs(hand_range):
 
-    return index_pairs
+    return [tuple(index_pair) for index_pair in np.argwhere(marginal_mask(hand_range)).tolist()]
 
 
 # TODO: Here's a hardwired dict that assigns "Prior action" strings to radio button settings. Add non-hardwired
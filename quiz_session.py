@@ -0,0 +1,162 @@
+"""The hand quiz, without any Qt.
+
+A QuizSession asks questions about the range dict loaded in a Model and grades the answers. The quiz window is a thin
+client of it, and it can just as well be driven from scripts and batch tools:
+
+    session = QuizSession(Model())
+    question = session.next_question()
+    answer = session.answer(question.options[0])
+"""
+import time
+import random
+import functools
+from collections import namedtuple
+
+from hand_range import as_hand_range, indices_to_hand_str
+from hand_sampler import HandSampler
+from spaced_repetition import ReviewItem
+
+
+Question = namedtuple('Question', ['spot', 'spot_indices', 'hand_indices', 'hand', 'options', 'prior_action'])
+
+
+class Answer(namedtuple('Answer', ['selected_option', 'is_correct', 'correct_action', 'correct_option', 'hand_indices',
+                                   'feedback_range_function', 'response_time'])):
+    """A graded answer. Its feedback range (the hands shown as the range of the selected option) is only worked out
+    when it's asked for."""
+
+    __slots__ = ()
+
+    @property
+    def feedback_range(self):
+
+        return as_hand_range(self.feedback_range_function())
+
+
+class QuizSession:
+
+    def __init__(self, model, rng=random, hand_sampler=None, scheduler=None):
+
+        self.model = model
+        self.rng = rng
+        self.hand_sampler = HandSampler() if hand_sampler is None else hand_sampler
+        self.scheduler = model.review_scheduler if scheduler is None else scheduler
+        self.question = None
+        self.question_time = None
+        self.answered = False
+
+    def next_question(self, randomize_spot=None):
+        """Asks the next question, in a random spot if `randomize_spot` (by default the model's "Random spot" setting).
+
+        With spaced repetition enabled, a question that is due for review (in any spot of the range dict if the spot is
+        random, otherwise in the current spot) comes first. Otherwise the hand is drawn at random.
+        """
+
+        if randomize_spot is None:
+            randomize_spot = self.model.randomize_range_in_hand_quiz
+
+        review_item = None
+        if self.model.hand_quiz_spaced_repetition:
+            spot_indices = None if randomize_spot else self.model.current_spot_indices
+            review_item = self.scheduler.next_due(self.model.range_dict_key, spot_indices)
+
+        if review_item is not None:
+            if randomize_spot:
+                self.model.set_radio_button_setting(dict(zip(self.model.range_dict_schema.keys(),
+                                                             review_item.spot_indices)))
+            self.model.hand_quiz_hand_indices = divmod(review_item.hand_id, 13)
+        else:
+            if randomize_spot:
+                self.model.set_radio_button_setting(self.model.random_radio_button_setting(self.rng))
+            self.model.hand_quiz_hand_indices = self.draw_hand_indices()
+
+        self.question = self.current_question()
+        self.question_time = time.monotonic()
+        self.answered = False
+
+        return self.question
+
+    def draw_hand_indices(self):
+        """Draws a hand with the odds of it being dealt, among the marginal hands of the spot if that's enabled."""
+
+        if self.model.hand_quiz_marginal_hands_only:
+            marginal_hand_range = self.model.marginal_hand_range
+            if not marginal_hand_range:
+                raise IndexError('No marginal hands in this spot.')
+            return self.hand_sampler.draw(marginal_hand_range, self.rng)
+
+        return self.hand_sampler.draw(rng=self.rng)
+
+    def current_question(self):
+
+        spot = dict(self.model.current_radio_button_setting)
+        hand_indices = self.model.hand_quiz_hand_indices
+
+        return Question(spot=spot,
+                        spot_indices=self.model.current_radio_button_indices,
+                        hand_indices=hand_indices,
+                        hand=indices_to_hand_str(*hand_indices),
+                        options=list(self.model.hand_quiz_answer_dict['options'][spot['Action']]),
+                        prior_action=self.prior_action(spot))
+
+    def prior_action(self, spot):
+
+        if spot['Action'] == 'RFI' and spot['Position'] == 'UTG':
+            return self.model.prior_action_dict['UTG_RFI']
+
+        action_str_or_dict = self.model.prior_action_dict[spot['Action']]
+        if type(action_str_or_dict) is str:
+            return action_str_or_dict
+        elif type(action_str_or_dict) is dict:
+            return action_str_or_dict[spot['VS']]
+        else:
+            raise ValueError
+
+    def answer(self, selected_option):
+        """Grades an answer to the current question.
+
+        The first answer to a question is written to the model's answer history and, with spaced repetition enabled,
+        recorded for review.
+        """
+
+        response_time = time.monotonic() - self.question_time if self.question_time is not None else None
+        correct_action = self.model.hand_quiz_correct_action
+        answer = Answer(selected_option=selected_option,
+                        is_correct=bool(self.model.hand_quiz_answer_is_correct(selected_option)),
+                        correct_action=correct_action,
+                        correct_option=self.model.action_to_quiz_option_dict.get(correct_action, correct_action),
+                        hand_indices=self.model.hand_quiz_hand_indices,
+                        feedback_range_function=functools.partial(self.model.answer_table.feedback_range,
+                                                                  self.model.current_radio_button_indices,
+                                                                  self.model.translate_quiz_answer(selected_option)),
+                        response_time=response_time)
+
+        if not self.answered:
+            self.answered = True
+            self.record(answer)
+
+        return answer
+
+    def grade_answers(self, spot_indices, hand_ids, selected_options):
+        """Grades many answers at once without recording them, e.g. for batch tools. See
+        `Model.quiz_answers_are_correct`."""
+
+        return self.model.quiz_answers_are_correct(spot_indices, hand_ids, selected_options)
+
+    def record(self, answer):
+
+        spot_indices = self.model.current_spot_indices
+        hand_id = answer.hand_indices[0] * 13 + answer.hand_indices[1]
+        timestamp = time.time()
+
+        if self.model.hand_quiz_spaced_repetition:
+            self.scheduler.record(ReviewItem(self.model.range_dict_key, spot_indices, hand_id), answer.is_correct,
+                                  timestamp)
+
+        self.model.error_heatmaps.record(self.model.range_dict_key, spot_indices, hand_id, answer.is_correct,
+                                         leaf_depth=self.model.leaf_depth(spot_indices))
+
+        if self.model.answer_history is not None:
+            self.model.answer_history.record(timestamp, self.model.range_dict_key, spot_indices, hand_id,
+                                             answer.selected_option, answer.correct_action, answer.is_correct,
+                                             answer.response_time)
@@ -0,0 +1,114 @@
+import os
+import threading
+from collections import OrderedDict
+
+from edit_journal import replay_edit_journals
+from range_pack import load_range_dict_file
+
+
+class RangeDictCache:
+    """LRU cache of compiled range dicts, keyed by file path and validated against the file's mtime.
+
+    Entries are evicted least recently used first once their total size exceeds `memory_budget` bytes. Dirty entries
+    (edited but not saved) are pinned: they are never evicted and are returned even if the file changed on disk.
+    The cache may be used from several threads; files are read and compiled outside the lock.
+    """
+
+    def __init__(self, memory_budget=256 * 1024 * 1024):
+
+        self.memory_budget = memory_budget
+        self.hits = 0
+        self.misses = 0
+        self.__lock = threading.RLock()
+        # Path -> (mtime, CompiledRangeDict), least recently used first.
+        self.__entries = OrderedDict()
+
+    @property
+    def nbytes(self):
+
+        with self.__lock:
+            return sum(compiled_range_dict.nbytes for _, compiled_range_dict in self.__entries.values())
+
+    def __len__(self):
+
+        return len(self.__entries)
+
+    def is_cached(self, path):
+
+        path = os.path.abspath(path)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            return False
+
+        with self.__lock:
+            return self.__cached(path, mtime) is not None
+
+    def load(self, path):
+
+        path = os.path.abspath(path)
+        mtime = os.stat(path).st_mtime_ns
+
+        with self.__lock:
+            compiled_range_dict = self.__cached(path, mtime)
+            if compiled_range_dict is not None:
+                self.hits += 1
+                self.__entries.move_to_end(path)
+                return compiled_range_dict
+            self.misses += 1
+
+        compiled_range_dict = load_range_dict_file(path)
+        replay_edit_journals(path, compiled_range_dict)
+
+        with self.__lock:
+            # Another thread may have loaded the same file in the meantime. Keep its copy, it may have been edited.
+            cached_range_dict = self.__cached(path, mtime)
+            if cached_range_dict is not None:
+                return cached_range_dict
+            self.__store(path, mtime, compiled_range_dict)
+
+        return compiled_range_dict
+
+    def discard(self, path):
+        """Drops the cached copy of `path`, even if it has unsaved edits."""
+
+        with self.__lock:
+            self.__entries.pop(os.path.abspath(path), None)
+
+    def saved(self, path, compiled_range_dict, edit_count):
+        """Registers `compiled_range_dict` as the contents of `path`, as of its first `edit_count` edits."""
+
+        path = os.path.abspath(path)
+        with self.__lock:
+            for cached_path, (_, cached_range_dict) in list(self.__entries.items()):
+                if cached_range_dict is compiled_range_dict:
+                    del self.__entries[cached_path]
+            compiled_range_dict.mark_saved(edit_count)
+            self.__store(path, os.stat(path).st_mtime_ns, compiled_range_dict)
+
+    def __cached(self, path, mtime):
+
+        if path in self.__entries:
+            cached_mtime, compiled_range_dict = self.__entries[path]
+            if compiled_range_dict.dirty or cached_mtime == mtime:
+                return compiled_range_dict
+
+        return None
+
+    def __store(self, path, mtime, compiled_range_dict):
+
+        self.__entries[path] = (mtime, compiled_range_dict)
+        self.__entries.move_to_end(path)
+        self.__evict(keep=path)
+
+    def __evict(self, keep):
+
+        total_nbytes = self.nbytes
+        for path in list(self.__entries.keys()):
+            if total_nbytes <= self.memory_budget:
+                break
+            _, compiled_range_dict = self.__entries[path]
+            if path == keep or compiled_range_dict.dirty:
+                continue
+            del self.__entries[path]
+            total_nbytes -= compiled_range_dict.nbytes
@@ -0,0 +1,174 @@
+"""Parses ranges written in the usual shorthand, e.g. '22+, A2s+, KTo+, T9s-54s, AJo:50%'.
+
+Terms are separated by commas or spaces:
+
+    QQ, AKs, AKo, AK    a pair, a suited or an offsuit hand, or both kinds of a non-pair
+    22+, A2s+, KTo+     a pair and all higher pairs, or a hand and all higher kickers (up to AQs, KQo)
+    QQ-88, A5s-A2s      every pair, or every kicker, between two hands
+    T9s-54s             every hand between two with the same gap (T9s, 98s, ..., 54s)
+
+A term may end with a frequency, ':50%', ':50' or ':0.5' (a number above 1 is a percentage). A block of terms may be
+tagged instead, '[50]AJo, KQo[/50]', where a term's own frequency overrides the tag's. Terms without one have a
+frequency of 100%. Later terms override earlier ones.
+
+As a plain range, an expression holds the hands played more than half the time: 'AJo:50%' is left out, 'AJo:51%' isn't.
+
+An expression compiles into a 13x13 frequency array laid out like the hand grid. The cells of each term are assigned
+in one slice from rank index tables. Compiled expressions are kept in an LRU cache, so parsing the same expression
+again is a dict lookup.
+"""
+import re
+from collections import OrderedDict
+
+import numpy as np
+
+
+RANKS = 'AKQJT98765432'
+RANK_INDICES = {rank: i for i, rank in enumerate(RANKS)}
+
+TERM_PATTERN = re.compile(r'(?P<hand>[AKQJT2-9]{2}[so]?)(?:(?P<plus>\+)|-(?P<end>[AKQJT2-9]{2}[so]?))?'
+                          r'(?::(?P<frequency>\d+(?:\.\d+)?)(?P<percent>%)?)?$')
+TAG_PATTERN = re.compile(r'\[(?P<frequency>\d+(?:\.\d+)?)\](?P<terms>.*?)\[/(?P=frequency)\]')
+SEPARATOR_PATTERN = re.compile(r'[,\s]+')
+
+
+class RangeExpressionError(ValueError):
+    pass
+
+
+def normalize_term(term):
+
+    return term.upper().replace('S', 's').replace('O', 'o')
+
+
+def split_terms(expression):
+
+    return [term for term in SEPARATOR_PATTERN.split(expression) if term]
+
+
+def parse_hand(hand_str):
+    """Returns (high rank index, low rank index, suitedness) of a hand like 'AKs', with suitedness 's', 'o' or ''."""
+
+    first_index = RANK_INDICES[hand_str[0]]
+    second_index = RANK_INDICES[hand_str[1]]
+    suitedness = hand_str[2:]
+    if first_index == second_index and suitedness:
+        raise RangeExpressionError('A pair can\'t be suited or offsuit: {}'.format(hand_str))
+
+    return min(first_index, second_index), max(first_index, second_index), suitedness
+
+
+def hand_cells(high_indices, low_indices, suitedness):
+    """Returns the grid rows and columns of hands given as arrays of high and low rank indices."""
+
+    if suitedness == 's':
+        return high_indices, low_indices
+    if suitedness == 'o':
+        return low_indices, high_indices
+
+    return np.concatenate([high_indices, low_indices]), np.concatenate([low_indices, high_indices])
+
+
+def between(start, stop):
+
+    return np.arange(min(start, stop), max(start, stop) + 1)
+
+
+def term_cells(term):
+    """Returns the grid rows and columns of a term, and its frequency."""
+
+    match = TERM_PATTERN.match(normalize_term(term))
+    if match is None:
+        raise RangeExpressionError('Not a hand or hand range: {}'.format(term))
+
+    frequency = 1.0
+    if match.group('frequency') is not None:
+        frequency = float(match.group('frequency'))
+        if match.group('percent') is not None or frequency > 1:
+            frequency /= 100
+        if frequency > 1:
+            raise RangeExpressionError('Frequency above 100%: {}'.format(term))
+
+    high_index, low_index, suitedness = parse_hand(match.group('hand'))
+    if high_index == low_index:
+        if match.group('plus') is not None:
+            pair_indices = np.arange(0, high_index + 1)
+        elif match.group('end') is not None:
+            end_high_index, end_low_index, _ = parse_hand(match.group('end'))
+            if end_high_index != end_low_index:
+                raise RangeExpressionError('A pair range must end with a pair: {}'.format(term))
+            pair_indices = between(high_index, end_high_index)
+        else:
+            pair_indices = np.array([high_index])
+        return (pair_indices, pair_indices), frequency
+
+    if match.group('plus') is not None:
+        # Every kicker up to one below the high card.
+        low_indices = np.arange(high_index + 1, low_index + 1)
+        high_indices = np.full(len(low_indices), high_index)
+    elif match.group('end') is not None:
+        end_high_index, end_low_index, end_suitedness = parse_hand(match.group('end'))
+        if end_suitedness != suitedness or end_high_index == end_low_index:
+            raise RangeExpressionError('A hand range must end with the same kind of hand: {}'.format(term))
+        if end_high_index == high_index:
+            low_indices = between(low_index, end_low_index)
+            high_indices = np.full(len(low_indices), high_index)
+        elif end_low_index - end_high_index == low_index - high_index:
+            high_indices = between(high_index, end_high_index)
+            low_indices = high_indices + (low_index - high_index)
+        else:
+            raise RangeExpressionError('The hands of a range must share a card or a gap: {}'.format(term))
+    else:
+        high_indices = np.array([high_index])
+        low_indices = np.array([low_index])
+
+    return hand_cells(high_indices, low_indices, suitedness), frequency
+
+
+def compile_range_expression(expression):
+    """Returns the frequency of every hand in `expression` as a 13x13 array."""
+
+    frequencies = np.zeros((13, 13))
+
+    terms = []
+    position = 0
+    for match in TAG_PATTERN.finditer(expression):
+        terms += split_terms(expression[position:match.start()])
+        terms += [term if ':' in term else '{}:{}%'.format(term, match.group('frequency'))
+                  for term in split_terms(match.group('terms'))]
+        position = match.end()
+    terms += split_terms(expression[position:])
+
+    for term in terms:
+        cells, frequency = term_cells(term)
+        frequencies[cells] = frequency
+
+    return frequencies
+
+
+class RangeExpressionParser:
+
+    def __init__(self, cache_size=4096):
+
+        self.cache_size = cache_size
+        self.__frequencies = OrderedDict()
+
+    def frequencies(self, expression):
+        """Returns the frequency of every hand in `expression` as a read-only 13x13 array."""
+
+        if expression in self.__frequencies:
+            self.__frequencies.move_to_end(expression)
+            return self.__frequencies[expression]
+
+        frequencies = compile_range_expression(expression)
+        frequencies.setflags(write=False)
+        self.__frequencies[expression] = frequencies
+        if len(self.__frequencies) > self.cache_size:
+            self.__frequencies.popitem(last=False)
+
+        return frequencies
+
+    def parse(self, expression, min_frequency=0.5):
+        """Returns the hands of `expression` played more than `min_frequency` of the time, as a 13x13 boolean array."""
+
+        return self.frequencies(expression) > min_frequency
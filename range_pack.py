@@ -0,0 +1,168 @@
+"""Memory-mappable binary format for range dicts ("range packs", *.rpk).
+
+Layout:
+
+    MAGIC                 4 bytes
+    header length         uint32, little endian
+    header                UTF-8 JSON: schema, inner nodes and the leaf index
+    padding               up to a multiple of 8 bytes
+    ranges                one HandRange per leaf, NUM_BYTES bytes each, in leaf index order
+
+Opening a range pack only parses the header. Each range is unpacked from the memory map the first time it's accessed.
+
+Run this module to convert every pickled range dict in range_dicts/ into a range pack next to it:
+
+    python range_pack.py [--update-list]
+"""
+import os
+import sys
+import glob
+import json
+import mmap
+import pickle
+import struct
+import tempfile
+from collections import OrderedDict
+
+import numpy as np
+
+from compiled_range_dict import CompiledRangeDict
+from hand_range import NUM_BYTES, NUM_HANDS
+
+
+MAGIC = b'RPK1'
+EXTENSION = '.rpk'
+
+
+def open_range_pack(path):
+
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            raise ValueError('{} is empty.'.format(path))
+        mapped_file = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    if mapped_file[:len(MAGIC)] != MAGIC:
+        raise ValueError('{} is not a range pack.'.format(path))
+    header_length, = struct.unpack_from('<I', mapped_file, len(MAGIC))
+    header_start = len(MAGIC) + 4
+    header = json.loads(mapped_file[header_start:header_start + header_length].decode('utf-8'))
+    data_start = aligned_offset(header_start + header_length)
+
+    schema = OrderedDict((label, choices) for label, choices in header['schema'])
+    # Packs written before choices listed twice mapped to their first index may use a later copy.
+    first_choice_indices = [[choices.index(choice) for choice in choices] for choices in schema.values()]
+
+    def first_choices(prefix):
+
+        return tuple(first_choice_indices[depth][index] for depth, index in enumerate(prefix))
+
+    children = {first_choices(prefix): [first_choice_indices[len(prefix)][index] for index in child_indices]
+                for prefix, child_indices in header['children']}
+    leaf_prefixes = [first_choices(prefix) for prefix in header['leaves']]
+    shape = tuple(len(choices) for choices in schema.values())
+    leaf_positions = {int(np.ravel_multi_index(prefix + (0,) * (len(shape) - len(prefix)), shape)): position
+                      for position, prefix in enumerate(leaf_prefixes)}
+
+    def range_loader(flat_index):
+        offset = data_start + leaf_positions[flat_index] * NUM_BYTES
+        packed = np.frombuffer(mapped_file, dtype=np.uint8, count=NUM_BYTES, offset=offset)
+        return np.unpackbits(packed, count=NUM_HANDS, bitorder='little').astype(bool).reshape((13, 13))
+
+    return CompiledRangeDict.from_layout(schema, children, leaf_prefixes, range_loader)
+
+
+def write_range_pack(path, compiled_range_dict, before_replace=None):
+
+    leaf_prefixes = list(compiled_range_dict.leaf_prefixes())
+    header = json.dumps({'schema': [[label, list(choices)] for label, choices in compiled_range_dict.schema.items()],
+                         'children': [[list(prefix), child_indices]
+                                      for prefix, child_indices in compiled_range_dict.children.items()],
+                         'leaves': [list(prefix) for prefix in leaf_prefixes]}).encode('utf-8')
+    header_end = len(MAGIC) + 4 + len(header)
+
+    ranges = np.stack([compiled_range_dict.range_at_prefix(prefix).ravel() for prefix in leaf_prefixes]) \
+        if leaf_prefixes else np.zeros((0, NUM_HANDS), dtype=bool)
+    packed_ranges = np.packbits(ranges, axis=1, bitorder='little')
+
+    def write(f):
+        f.write(MAGIC)
+        f.write(struct.pack('<I', len(header)))
+        f.write(header)
+        f.write(b'\0' * (aligned_offset(header_end) - header_end))
+        f.write(packed_ranges.tobytes())
+
+    write_atomically(path, write, before_replace=before_replace)
+
+
+def write_atomically(path, write, mode='wb', before_replace=None):
+    """Calls `write(f)` on a temporary file next to `path`, then moves it over `path` in one step.
+
+    `before_replace(temp_path)` is called once the temporary file is complete, just before the move.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    file_descriptor, temp_path = tempfile.mkstemp(dir=directory, prefix='.', suffix='.tmp')
+    try:
+        with os.fdopen(file_descriptor, mode) as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        if before_replace is not None:
+            before_replace(temp_path)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+def load_range_dict_file(path):
+
+    if os.path.splitext(path)[1] == EXTENSION:
+        return open_range_pack(path)
+
+    with open(path, 'rb') as f:
+        top_level_dict = pickle.load(f)
+
+    return CompiledRangeDict(top_level_dict)
+
+
+def save_range_dict_file(path, compiled_range_dict, before_replace=None):
+    """Writes a range dict in the format given by the extension of `path`, replacing the file atomically."""
+
+    if os.path.splitext(path)[1] == EXTENSION:
+        write_range_pack(path, compiled_range_dict, before_replace)
+    else:
+        top_level_dict = compiled_range_dict.to_top_level_dict()
+        write_atomically(path, lambda f: pickle.dump(top_level_dict, f), before_replace=before_replace)
+
+
+def aligned_offset(position, alignment=8):
+
+    return -(-position // alignment) * alignment
+
+
+def convert_range_dicts(range_dict_dir, update_list=False):
+
+    converted_paths = {}
+    for pickle_path in sorted(glob.glob(os.path.join(range_dict_dir, '*.pkl'))):
+        range_pack_path = os.path.splitext(pickle_path)[0] + EXTENSION
+        write_range_pack(range_pack_path, load_range_dict_file(pickle_path))
+        converted_paths[os.path.basename(pickle_path)] = os.path.basename(range_pack_path)
+        print('{} -> {}'.format(pickle_path, range_pack_path))
+
+    if update_list:
+        range_dict_list_filepath = os.path.join(range_dict_dir, 'range_dict_list.json')
+        with open(range_dict_list_filepath, 'r') as f:
+            range_dict_list = json.load(f)
+        for range_dict_descriptor in range_dict_list:
+            filepath = range_dict_descriptor['Filepath']
+            if filepath is not None and os.path.basename(filepath) in converted_paths:
+                range_dict_descriptor['Filepath'] = os.path.join(os.path.dirname(filepath),
+                                                                 converted_paths[os.path.basename(filepath)])
+        with open(range_dict_list_filepath, 'w') as f:
+            json.dump(range_dict_list, f, indent=4)
+
+
+if __name__ == '__main__':
+
+    convert_range_dicts(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'range_dicts'),
+                        update_list='--update-list' in sys.argv[1:])
@@ -0,0 +1,208 @@
+"""Spaced repetition of quiz questions.
+
+Every answered question is a review item: a hand in a spot of a range dict. Its recall state follows a simplified SM-2
+schedule. A wrong answer brings the item back after a minute. Right answers space it out over the learning steps, and
+then by a growing factor (the item's ease).
+
+Due items are kept in binary heaps ordered by due time, one per range dict and one per spot. Finding the next due item
+is O(log n) however many items there are. Heap entries are never updated in place. Rescheduling an item pushes a new
+entry and bumps the item's version, and entries with an old version are dropped when they reach the top.
+
+The recall states are snapshotted to an .npz file, along with how much of the answer history they cover, so that a
+new session picks up where the last one left off (see `Model.load_review_state`).
+"""
+import json
+import time
+import heapq
+import itertools
+from collections import defaultdict, namedtuple
+
+import numpy as np
+
+from range_pack import write_atomically
+
+
+ReviewItem = namedtuple('ReviewItem', ['range_dict_key', 'spot_indices', 'hand_id'])
+
+
+class RecallState:
+
+    __slots__ = ('repetitions', 'lapses', 'ease', 'interval', 'due', 'version')
+
+    def __init__(self, ease):
+
+        self.repetitions = 0
+        self.lapses = 0
+        self.ease = ease
+        self.interval = 0.0
+        self.due = 0.0
+        self.version = 0
+
+
+class SpacedRepetitionScheduler:
+
+    LEARNING_STEPS = (60.0, 10 * 60.0, 24 * 60 * 60.0)
+    INITIAL_EASE = 2.5
+    MIN_EASE = 1.3
+    EASE_BONUS = 0.1
+    EASE_PENALTY = 0.2
+    # An item that was asked but not answered comes back after this many seconds.
+    RETRY_DELAY = 60.0
+
+    def __init__(self, clock=time.time):
+
+        self.clock = clock
+        self.__states = {}
+        self.__heaps = defaultdict(list)
+        self.__num_heap_entries = 0
+        self.__sequence = itertools.count()
+        # The time of the latest answer recorded.
+        self.last_record_time = None
+        # The (item, is_correct, time) of every answer recorded between `start_log` and `restore`.
+        self.__log = None
+
+    def __len__(self):
+
+        return len(self.__states)
+
+    def __contains__(self, item):
+
+        return item in self.__states
+
+    def state(self, item):
+
+        return self.__states.get(item)
+
+    def record(self, item, is_correct, now=None):
+        """Updates the recall state of `item` after an answer at `now` (by default the clock's time) and schedules its
+        next review."""
+
+        if now is None:
+            now = self.clock()
+        if self.__log is not None:
+            self.__log.append((item, is_correct, now))
+        if self.last_record_time is None or now > self.last_record_time:
+            self.last_record_time = now
+
+        state = self.__states.get(item)
+        if state is None:
+            state = self.__states[item] = RecallState(self.INITIAL_EASE)
+
+        if is_correct:
+            if state.repetitions < len(self.LEARNING_STEPS):
+                state.interval = self.LEARNING_STEPS[state.repetitions]
+            else:
+                state.interval *= state.ease
+                state.ease += self.EASE_BONUS
+            state.repetitions += 1
+        else:
+            state.repetitions = 0
+            state.lapses += 1
+            state.interval = self.LEARNING_STEPS[0]
+            state.ease = max(self.MIN_EASE, state.ease - self.EASE_PENALTY)
+
+        self.__schedule(item, state, now + state.interval)
+
+    def start_log(self):
+        """Logs the answers recorded from now on, to be recorded again by `restore`."""
+
+        if self.__log is None:
+            self.__log = []
+
+    def restore(self, saved):
+        """Takes over the recall states of `saved` (e.g. a snapshot loaded on a worker thread), then records the answers
+        logged since `start_log` on top of them. `saved` can't be used afterwards."""
+
+        log, self.__log = self.__log or [], None
+        self.__states = saved.__states
+        self.last_record_time = saved.last_record_time
+        self.__compact()
+        for item, is_correct, now in log:
+            self.record(item, is_correct, now)
+
+    def next_due(self, range_dict_key, spot_indices=None):
+        """Takes the most overdue item of a range dict (or of one of its spots), or returns None if nothing is due.
+
+        The item is rescheduled RETRY_DELAY seconds ahead, so that skipping it doesn't lose it.
+        """
+
+        scope = (range_dict_key,) if spot_indices is None else (range_dict_key, tuple(spot_indices))
+        heap = self.__heaps.get(scope)
+        now = self.clock()
+        while heap:
+            due, _, version, item = heap[0]
+            if version != self.__states[item].version:
+                heapq.heappop(heap)
+                self.__num_heap_entries -= 1
+                continue
+            if due > now:
+                return None
+            self.__schedule(item, self.__states[item], now + self.RETRY_DELAY)
+            return item
+
+        return None
+
+    def __schedule(self, item, state, due):
+
+        state.due = due
+        state.version += 1
+        for scope in ((item.range_dict_key,), (item.range_dict_key, item.spot_indices)):
+            heapq.heappush(self.__heaps[scope], (due, next(self.__sequence), state.version, item))
+        self.__num_heap_entries += 2
+
+        # Stale entries below the top of a heap are only dropped here.
+        if self.__num_heap_entries > 8 * len(self.__states) + 1024:
+            self.__compact()
+
+    def __compact(self):
+
+        self.__heaps = defaultdict(list)
+        for item, state in self.__states.items():
+            for scope in ((item.range_dict_key,), (item.range_dict_key, item.spot_indices)):
+                self.__heaps[scope].append((state.due, next(self.__sequence), state.version, item))
+        for heap in self.__heaps.values():
+            heapq.heapify(heap)
+        self.__num_heap_entries = 2 * len(self.__states)
+
+    def arrays(self):
+        """Returns a [range dict, spot indices, hand id] key for every item, and their recall states as one array."""
+
+        keys = [[item.range_dict_key, list(item.spot_indices), item.hand_id] for item in self.__states.keys()]
+        states = np.array([(state.repetitions, state.lapses, state.ease, state.interval, state.due)
+                           for state in self.__states.values()], dtype=np.float64).reshape((-1, 5))
+
+        return keys, states
+
+    @classmethod
+    def load(cls, path):
+        """Returns the scheduler in a snapshot written by `save_review_state`, and the last history id it covers."""
+
+        with np.load(path) as snapshot:
+            keys = json.loads(str(snapshot['keys']))
+            states = snapshot['states']
+            history_last_id = int(snapshot['history_last_id'])
+            last_record_time = float(snapshot['last_record_time'])
+
+        scheduler = cls()
+        for (range_dict_key, spot_indices, hand_id), (repetitions, lapses, ease, interval, due) in zip(keys, states):
+            state = RecallState(float(ease))
+            state.repetitions = int(repetitions)
+            state.lapses = int(lapses)
+            state.interval = float(interval)
+            state.due = float(due)
+            scheduler.__states[ReviewItem(range_dict_key, tuple(spot_indices), hand_id)] = state
+        scheduler.last_record_time = last_record_time if not np.isnan(last_record_time) else None
+        scheduler.__compact()
+
+        return scheduler, history_last_id
+
+
+def save_review_state(path, keys, states, history_last_id, last_record_time):
+    """Writes the keys and states of `SpacedRepetitionScheduler.arrays` to an .npz file.
+
+    The snapshot covers the answer history up to `history_last_id`, and the answers after it up to `last_record_time`.
+    """
+
+    last_record_time = np.nan if last_record_time is None else last_record_time
+    write_atomically(path, lambda f: np.savez(f, keys=np.array(json.dumps(keys)), states=states,
+                                              history_last_id=history_last_id, last_record_time=last_record_time))
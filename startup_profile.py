@@ -0,0 +1,63 @@
+"""Timing of the startup steps, for `python main.py --profile-startup`.
+
+Each step is timed from the end of the previous one, starting from `start_time` (taken before the imports in main.py).
+The report is printed once the initial range dict is on screen.
+"""
+import time
+
+from PySide2.QtCore import QEvent, QObject
+
+
+class StartupProfile:
+
+    def __init__(self, start_time, enabled=True):
+
+        self.enabled = enabled
+        self.start_time = start_time
+        # (step name, seconds since the start), in order.
+        self.marks = []
+        self.finished = False
+
+    def mark(self, step_name):
+
+        if self.enabled:
+            self.marks.append((step_name, time.perf_counter() - self.start_time))
+
+    def finish(self, step_name):
+        """Marks the last step and prints the report, the first time it's called."""
+
+        if self.enabled and not self.finished:
+            self.finished = True
+            self.mark(step_name)
+            print(self.report(), flush=True)
+
+    def report(self):
+
+        lines = ['{:<24}{:>10}{:>10}'.format('Startup step', 'ms', 'total ms')]
+        previous_time = 0.0
+        for step_name, mark_time in self.marks:
+            lines.append('{:<24}{:>10.1f}{:>10.1f}'.format(step_name, (mark_time - previous_time) * 1000,
+                                                           mark_time * 1000))
+            previous_time = mark_time
+
+        return '\n'.join(lines)
+
+
+class FirstPaintFilter(QObject):
+    """Calls `callback` once, when the watched widget is first painted."""
+
+    def __init__(self, widget, callback):
+
+        super().__init__()
+        self.widget = widget
+        self.callback = callback
+        widget.installEventFilter(self)
+
+    def eventFilter(self, watched, event):
+
+        if event.type() == QEvent.Paint and self.callback is not None:
+            callback, self.callback = self.callback, None
+            self.widget.removeEventFilter(self)
+            callback()
+
+        return False
@@ -0,0 +1,199 @@
+"""Opt-in tracing of the Controller's slots and of the Model calls under them.
+
+Set RANGES_TRAINER_TRACE to a file path to turn it on:
+
+    RANGES_TRAINER_TRACE=trace.json python main.py
+
+Every traced call is recorded as a span (name, start, duration, thread) in a ring buffer that keeps the most recent
+spans. Spans of calls made from a traced call nest inside it, so a slow click shows which layer the time went to. So
+do event loop stalls: stretches where the Qt event loop didn't get to run. On exit the buffer is written as Chrome
+trace-event JSON, which chrome://tracing and https://ui.perfetto.dev open.
+
+Tracing works by wrapping the methods on their classes, before any of them are instantiated. With the variable unset
+nothing is wrapped, so there is no overhead.
+"""
+import os
+import json
+import time
+import functools
+import threading
+from collections import deque
+
+from PySide2.QtCore import QTimer
+
+from range_pack import write_atomically
+
+
+TRACE_ENV_VAR = 'RANGES_TRAINER_TRACE'
+
+TRACED_CONTROLLER_METHODS = (
+    'radio_button_slot',
+    'random_button_slot',
+    'range_dict_list_index_change_slot',
+    'range_dict_loaded_slot',
+    'quiz_button_slot',
+    'next_hand_button_slot',
+    'answer_button_slot',
+    'check_button_slot',
+    'copy_range_button_slot',
+    'paste_range_button_slot',
+    'invert_range_button_slot',
+    'save_button_slot',
+    'error_heatmap_button_slot',
+    'hand_grid_cells_changed_slot',
+    'update_radio_buttons',
+    'update_model_on_radio_buttons',
+    'disable_all_radio_buttons',
+    'enable_applicable_radio_buttons',
+    'check_model_radio_buttons',
+    'display_range_dict',
+)
+TRACED_MODEL_METHODS = (
+    'set_radio_button_setting',
+    'random_radio_button_setting',
+    'check_default_radio_buttons',
+    'load_range_dict',
+    'save_range_dict',
+    'set_reference_range_cell',
+    'set_reference_range',
+    'set_range',
+    'translate_quiz_answer',
+    'hand_quiz_answer_is_correct',
+    'quiz_feedback_range',
+    'current_error_rates',
+)
+TRACED_MODEL_PROPERTIES = (
+    'reference_range',
+    'applicable_radio_buttons',
+    'current_spot_indices',
+    'answer_table',
+    'hand_quiz_correct_action',
+    'combined_alternatives_range',
+    'marginal_hand_ids',
+)
+TRACED_QUIZ_SESSION_METHODS = (
+    'next_question',
+    'draw_hand_indices',
+    'answer',
+    'record',
+)
+
+
+class Tracer:
+
+    def __init__(self, capacity=100000):
+
+        # (name, category, start ns, duration ns, thread id), oldest first.
+        self.spans = deque(maxlen=capacity)
+        self.start_ns = time.perf_counter_ns()
+
+    def record(self, name, category, start_ns, duration_ns):
+
+        self.spans.append((name, category, start_ns, duration_ns, threading.get_ident()))
+
+    def traced(self, function, name, category):
+        """Returns a wrapper of `function` that records a span for every call.
+
+        The wrapper drops positional arguments `function` doesn't take, like a Qt slot connection would (PySide2 only
+        does that for functions it can inspect).
+        """
+
+        code = function.__code__
+        takes_varargs = bool(code.co_flags & 0x04)
+        num_positional_args = code.co_argcount
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+
+            if not takes_varargs:
+                args = args[:num_positional_args]
+            start_ns = time.perf_counter_ns()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.spans.append((name, category, start_ns, time.perf_counter_ns() - start_ns,
+                                   threading.get_ident()))
+
+        return wrapper
+
+    def trace_methods(self, cls, method_names, category):
+
+        for method_name in method_names:
+            setattr(cls, method_name, self.traced(getattr(cls, method_name),
+                                                  '{}.{}'.format(cls.__name__, method_name), category))
+
+    def trace_properties(self, cls, property_names, category):
+
+        for property_name in property_names:
+            prop = getattr(cls, property_name)
+            fget = self.traced(prop.fget, '{}.{}'.format(cls.__name__, property_name), category)
+            setattr(cls, property_name, property(fget, prop.fset, prop.fdel, prop.__doc__))
+
+    def chrome_trace(self):
+
+        process_id = os.getpid()
+        thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+        spans = list(self.spans)
+
+        trace_events = [{'name': 'thread_name', 'ph': 'M', 'pid': process_id, 'tid': thread_id,
+                         'args': {'name': thread_names.get(thread_id, str(thread_id))}}
+                        for thread_id in sorted({span[4] for span in spans})]
+        trace_events += [{'name': name, 'cat': category, 'ph': 'X', 'pid': process_id, 'tid': thread_id,
+                          'ts': (start_ns - self.start_ns) / 1000, 'dur': duration_ns / 1000}
+                         for name, category, start_ns, duration_ns, thread_id in spans]
+
+        return {'traceEvents': trace_events, 'displayTimeUnit': 'ms'}
+
+    def write_chrome_trace(self, path):
+
+        trace = self.chrome_trace()
+        write_atomically(path, lambda f: json.dump(trace, f), mode='w')
+
+
+class EventLoopStallMonitor:
+    """Records a span whenever the Qt event loop runs a timer more than `threshold_ms` late."""
+
+    def __init__(self, tracer, interval_ms=10, threshold_ms=50):
+
+        self.tracer = tracer
+        self.interval_ns = interval_ms * 1000000
+        self.threshold_ns = threshold_ms * 1000000
+        self.__last_tick_ns = None
+        self.__timer = QTimer()
+        self.__timer.setInterval(interval_ms)
+        self.__timer.timeout.connect(self.__tick)
+
+    def start(self):
+
+        self.__last_tick_ns = time.perf_counter_ns()
+        self.__timer.start()
+
+    def stop(self):
+
+        self.__timer.stop()
+
+    def __tick(self):
+
+        now_ns = time.perf_counter_ns()
+        stall_start_ns = self.__last_tick_ns + self.interval_ns
+        if now_ns - stall_start_ns > self.threshold_ns:
+            self.tracer.record('event loop stall', 'stall', stall_start_ns, now_ns - stall_start_ns)
+        self.__last_tick_ns = now_ns
+
+
+def install(tracer):
+    """Wraps the traced methods of the Controller, Model and QuizSession classes. Call before instantiating them."""
+
+    from controller import Controller
+    from model import Model
+    from quiz_session import QuizSession
+
+    tracer.trace_methods(Controller, TRACED_CONTROLLER_METHODS, 'controller')
+    tracer.trace_methods(Model, TRACED_MODEL_METHODS, 'model')
+    tracer.trace_properties(Model, TRACED_MODEL_PROPERTIES, 'model')
+    tracer.trace_methods(QuizSession, TRACED_QUIZ_SESSION_METHODS, 'quiz_session')
+
+
+def trace_path_from_environment():
+
+    return os.environ.get(TRACE_ENV_VAR) or None
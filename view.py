@@ -1,11 +1,13 @@
 import sys
-import random
-from PySide2.QtCore import Qt, Signal
-from PySide2.QtGui import QEnterEvent, QKeyEvent
-from PySide2.QtWidgets import QWidget, QLabel, QGridLayout, QVBoxLayout, QHBoxLayout, QToolButton, \
-    QPushButton, QRadioButton, QButtonGroup, QSizePolicy, QComboBox, QApplication, QFrame, QCheckBox
+import numpy as np
+from PySide2.QtCore import Qt, Signal, QRectF
+from PySide2.QtGui import QColor, QMouseEvent, QPainter, QPaintEvent, QTextOption
+from PySide2.QtWidgets import QWidget, QLabel, QGridLayout, QVBoxLayout, QHBoxLayout, \
+    QPushButton, QRadioButton, QButtonGroup, QSizePolicy, QComboBox, QApplication, QFrame, QCheckBox, QLineEdit
 
 from model import Model
+from hand_range import indices_to_hand_str
+from quiz_session import QuizSession
 
 
 def to_list_index(row_i, col_i, num_cols=13):
@@ -24,57 +26,170 @@ def clear_layout(layout):
             child.layout().deleteLater()
 
 
-# I'd like to be able to toggle hand grid buttons by holding the left mouse button down and dragging the cursor over
-# them. Unfortunately the way widgets grab the mouse makes that very complicated, so until I find a way to make that
-# work, it will be the shift key that needs to be held down while dragging the cursor over the buttons.
-class HandGridButton(QToolButton):
+# Visual states of hand grid cells.
+UNSTYLED = -1
+PLAIN = 0
+EDITING_UNCHECKED = 1
+EDITING_CHECKED = 2
+INCORRECTLY_CHECKED = 3
+INCORRECTLY_LEFT_UNCHECKED = 4
+CORRECTLY_CHECKED = 5
+FEEDBACK_RANGE = 6
+QUIZ_HAND_CORRECT = 7
+QUIZ_HAND_INCORRECT = 8
+# Error-rate heatmap levels, from no mistakes to mistakes on more than three quarters of the answers.
+ERROR_RATE_LEVELS = (9, 10, 11, 12, 13)
+
+# Background and text colours of each visual state.
+hand_grid_colors = {
+    UNSTYLED: ('white', 'black'),
+    PLAIN: ('white', 'black'),
+    EDITING_UNCHECKED: ('gray', 'white'),
+    EDITING_CHECKED: ('deeppink', 'black'),
+    INCORRECTLY_CHECKED: ('red', 'black'),
+    INCORRECTLY_LEFT_UNCHECKED: ('yellow', 'black'),
+    CORRECTLY_CHECKED: ('lime', 'black'),
+    FEEDBACK_RANGE: ('darkblue', 'white'),
+    QUIZ_HAND_CORRECT: ('darkgreen', 'white'),
+    QUIZ_HAND_INCORRECT: ('darkred', 'white'),
+    ERROR_RATE_LEVELS[0]: ('palegreen', 'black'),
+    ERROR_RATE_LEVELS[1]: ('khaki', 'black'),
+    ERROR_RATE_LEVELS[2]: ('orange', 'black'),
+    ERROR_RATE_LEVELS[3]: ('orangered', 'white'),
+    ERROR_RATE_LEVELS[4]: ('darkred', 'white')
+}
+# Unstyled and plain cells are shaded like pressed buttons while they're checked.
+hand_grid_checked_color = 'lightsteelblue'
+hand_grid_line_color = 'darkgray'
+
+
+class HandGridWidget(QWidget):
+    """The 13x13 hand grid, painted as one widget from a checked array and a visual state array.
+
+    Clicking a cell toggles it, and dragging with the button held down gives every cell the stroke passes over the
+    value of the first one. Each change to the checked array, whether made by the user or through `set_checked`, is
+    reported with a single `cells_changed` emission carrying the flat ids of the changed cells.
+    """
 
-    def __init__(self):
+    cells_changed = Signal(object)
+
+    def __init__(self, cell_size=50):
 
         super().__init__()
-        self.shift_key_pressed = False
+        self.checked = np.zeros(13 * 13, dtype=bool)
+        self.states = np.full(13 * 13, UNSTYLED, dtype=np.int8)
+        self.hand_strs = [indices_to_hand_str(*divmod(id, 13)) for id in range(13 * 13)]
+        self.colors = {state: (QColor(background), QColor(text)) for state, (background, text) in hand_grid_colors.items()}
+        self.checked_color = QColor(hand_grid_checked_color)
+        self.line_color = QColor(hand_grid_line_color)
+        self.text_option = QTextOption(Qt.AlignCenter)
+        self.__stroke_value = None
+        self.__stroke_id = None
+
+        self.setMinimumSize(13 * cell_size, 13 * cell_size)
+        self.setSizePolicy(QSizePolicy.Fixed, QSizePolicy.Fixed)
+
+    def sizeHint(self):
+
+        return self.minimumSize()
 
-    def enterEvent(self, event: QEnterEvent):
+    def cell_size(self):
 
-        if self.shift_key_pressed:
-            self.toggle()
+        return min(self.width(), self.height()) / 13
 
+    def cell_rect(self, id):
 
-class CustomWindow(QWidget):
+        row_i, col_i = divmod(id, 13)
+        cell_size = self.cell_size()
 
-    shift_key_pressed = Signal()
-    shift_key_released = Signal()
+        return QRectF(col_i * cell_size, row_i * cell_size, cell_size, cell_size)
 
-    def keyPressEvent(self, event: QKeyEvent) -> None:
+    def id_at(self, position):
 
-        if event.key() == Qt.Key_Shift:
-            self.shift_key_pressed.emit()
-        super().keyPressEvent(event)
+        cell_size = self.cell_size()
+        row_i = int(position.y() // cell_size)
+        col_i = int(position.x() // cell_size)
+        if 0 <= row_i < 13 and 0 <= col_i < 13:
+            return to_list_index(row_i, col_i)
 
-    def keyReleaseEvent(self, event: QKeyEvent) -> None:
+        return None
 
-        if event.key() == Qt.Key_Shift:
-            self.shift_key_released.emit()
+    def set_checked(self, checked):
 
+        checked = np.asarray(checked, dtype=bool).ravel()
+        changed_ids = np.flatnonzero(checked != self.checked)
+        if len(changed_ids) == 0:
+            return
 
-def indices_to_hand_str(i, j):
+        self.checked = checked.copy()
+        self.__update_cells(changed_ids)
+        self.cells_changed.emit(changed_ids)
 
-    card_ranks = 'AKQJT98765432'
+    def set_states(self, states):
+
+        states = np.asarray(states, dtype=np.int8).ravel()
+        changed_ids = np.flatnonzero(states != self.states)
+        if len(changed_ids) == 0:
+            return
+
+        self.states = states.copy()
+        self.__update_cells(changed_ids)
+
+    def __update_cells(self, ids):
+
+        # Qt merges the dirty rectangles, so this still results in a single paint event.
+        for id in ids.tolist():
+            self.update(self.cell_rect(id).toAlignedRect())
+
+    def paintEvent(self, event: QPaintEvent):
+
+        painter = QPainter(self)
+        exposed_rect = QRectF(event.rect())
+        for id in range(13 * 13):
+            rect = self.cell_rect(id)
+            if not exposed_rect.intersects(rect):
+                continue
+            state = int(self.states[id])
+            background_color, text_color = self.colors[state]
+            if self.checked[id] and state in {UNSTYLED, PLAIN}:
+                background_color = self.checked_color
+            painter.fillRect(rect, background_color)
+            painter.setPen(self.line_color)
+            painter.drawRect(rect)
+            painter.setPen(text_color)
+            painter.drawText(rect, self.hand_strs[id], self.text_option)
+        painter.end()
 
-    if i < j:
-        rank1 = card_ranks[i]
-        rank2 = card_ranks[j]
-        suited_str = 's'
-    elif i > j:
-        rank1 = card_ranks[j]
-        rank2 = card_ranks[i]
-        suited_str = 'o'
-    else:
-        rank1 = card_ranks[i]
-        rank2 = card_ranks[j]
-        suited_str = ''
+    def mousePressEvent(self, event: QMouseEvent):
 
-    return '{}{}{}'.format(rank1, rank2, suited_str)
+        if event.button() != Qt.LeftButton:
+            return super().mousePressEvent(event)
+
+        id = self.id_at(event.pos())
+        if id is not None:
+            self.__stroke_value = not self.checked[id]
+            self.__paint_cell(id)
+
+    def mouseMoveEvent(self, event: QMouseEvent):
+
+        if self.__stroke_value is None:
+            return super().mouseMoveEvent(event)
+
+        id = self.id_at(event.pos())
+        if id is not None and id != self.__stroke_id:
+            self.__paint_cell(id)
+
+    def mouseReleaseEvent(self, event: QMouseEvent):
+
+        self.__stroke_value = None
+        self.__stroke_id = None
+
+    def __paint_cell(self, id):
+
+        self.__stroke_id = id
+        checked = self.checked.copy()
+        checked[id] = self.__stroke_value
+        self.set_checked(checked)
 
 
 class View:
@@ -82,139 +197,136 @@ class View:
     def __init__(self, model: Model):
 
         self.model = model
-        self.quiz_view = QuizView(model)
+        # The quiz window is only built once the quiz is first opened (see `create_quiz_view`).
+        self.quiz_view = None
 
-        self.window = CustomWindow()
+        self.window = QWidget()
         self.parent_layout = QHBoxLayout()
-        self.hand_grid_layout = QGridLayout()
+        self.hand_grid_widget = HandGridWidget()
         self.side_bar_layout = QVBoxLayout()
         self.range_dict_button_layout = QGridLayout()
         self.radio_button_parent_layout = QVBoxLayout()
         self.command_button_layout = QGridLayout()  #QHBoxLayout()
 
         self.range_dict_list_widget = QComboBox()
+        self.range_dict_loading_label = QLabel()
 
-        self.parent_layout.addLayout(self.hand_grid_layout)
+        self.parent_layout.addWidget(self.hand_grid_widget)
         self.parent_layout.addLayout(self.side_bar_layout)
         self.side_bar_layout.addWidget(self.range_dict_list_widget)
+        self.side_bar_layout.addWidget(self.range_dict_loading_label)
         self.side_bar_layout.addLayout(self.range_dict_button_layout)
         self.side_bar_layout.addLayout(self.radio_button_parent_layout)
         self.side_bar_layout.addLayout(self.command_button_layout)
 
-        self.hand_grid_button_group = QButtonGroup()
-        self.hand_grid_button_group.setExclusive(False)
         self.new_range_dict_button = QPushButton('New')
         self.edit_range_dict_button = QPushButton('Edit')
         self.save_range_dict_button = QPushButton('Save')
+        self.revert_range_dict_button = QPushButton('Revert')
         self.copy_range_button = QPushButton('Copy')
         self.paste_range_button = QPushButton('Paste')
         self.invert_range_button = QPushButton('Invert')
+        self.range_expression_edit = QLineEdit()
         self.random_button = QPushButton('Random range')
         self.quiz_button = QPushButton('Hand quiz')
         self.check_button = QPushButton('Check')
         self.reset_button = QPushButton('Reset')
-
-        for i in range(13):
-            self.hand_grid_layout.setColumnMinimumWidth(i, 50)
-            self.hand_grid_layout.setRowMinimumHeight(i, 50)
-        self.hand_grid_layout.setHorizontalSpacing(0)
-        self.hand_grid_layout.setVerticalSpacing(0)
+        self.error_heatmap_button = QPushButton('Mistakes')
+        self.error_heatmap_scope_widget = QComboBox()
 
         self.edit_range_dict_button.setCheckable(True)
 
-        self.hand_button_size_policy = QSizePolicy()
-        self.hand_button_size_policy.setHeightForWidth(True)
-        self.hand_button_size_policy.setVerticalPolicy(QSizePolicy.Minimum)
-        self.hand_button_size_policy.setHorizontalPolicy(QSizePolicy.Ignored)
-
-        self.__populate_hand_grid_layout()
         self.range_dict_button_layout.addWidget(self.new_range_dict_button, 0, 0)
         self.range_dict_button_layout.addWidget(self.edit_range_dict_button, 0, 1)
         self.range_dict_button_layout.addWidget(self.save_range_dict_button, 0, 2)
         self.range_dict_button_layout.addWidget(self.copy_range_button, 1, 0)
         self.range_dict_button_layout.addWidget(self.paste_range_button, 1, 1)
         self.range_dict_button_layout.addWidget(self.invert_range_button, 1, 2)
+        self.range_dict_button_layout.addWidget(self.revert_range_dict_button, 2, 2)
+        self.range_dict_button_layout.addWidget(self.range_expression_edit, 3, 0, 1, 3)
         self.command_button_layout.addWidget(self.random_button, 0, 0)
         self.command_button_layout.addWidget(self.quiz_button, 0, 1)
         self.command_button_layout.addWidget(self.check_button, 1, 0)
         self.command_button_layout.addWidget(self.reset_button, 1, 1)
+        self.command_button_layout.addWidget(self.error_heatmap_button, 2, 0)
+        self.command_button_layout.addWidget(self.error_heatmap_scope_widget, 2, 1)
 
         self.populate_radio_button_parent_layout()
+        self.populate_error_heatmap_scope_widget()
 
         self.parent_layout.setSizeConstraint(QHBoxLayout.SetFixedSize)
 
         self.window.setLayout(self.parent_layout)
-
-        self.hand_button_editing_mode_style_sheet_unchecked = 'background-color: gray; color: white'
-        self.hand_button_editing_mode_style_sheet_checked = 'background-color: deeppink; color: black'
         self.new_range_dict_dialog_title = 'Create new range dict'
         self.new_range_dict_dialog_label = 'New range dict name:'
+        self.revert_range_dict_dialog_title = 'Revert range dict'
+        self.revert_range_dict_dialog_text = 'Discard all edits since the range dict was last saved?'
+        self.range_dict_loading_text = '<i>Loading range dict...</i>'
+        self.range_dict_load_failed_text = '<i>Could not load range dict: {}</i>'
+
+        self.range_dict_loading_label.setVisible(False)
+        self.range_expression_edit.setPlaceholderText('Range, e.g. 22+, A2s+, KTo+, T9s-54s')
+
+    def create_quiz_view(self):
+
+        self.quiz_view = QuizView(self.model)
+
+        return self.quiz_view
+
+    def set_range_dict_loading(self, loading):
+
+        self.range_dict_loading_label.setText(self.range_dict_loading_text)
+        self.range_dict_loading_label.setVisible(loading)
+        # These need a range dict, so they stay disabled if loading the first one failed.
+        range_dict_ready = not loading and self.model.range_dict_loaded
+        self.edit_range_dict_button.setEnabled(range_dict_ready)
+        for button in [self.random_button, self.quiz_button, self.check_button, self.error_heatmap_button]:
+            button.setEnabled(range_dict_ready and not self.model.editing_mode)
+
+    def set_range_dict_load_failed(self, message):
+
+        self.set_range_dict_loading(False)
+        self.range_dict_loading_label.setText(self.range_dict_load_failed_text.format(message))
+        self.range_dict_loading_label.setVisible(True)
 
     def display_feedback(self):
 
-        incorrectly_checked_button_ids = self.model.incorrectly_checked.flatten().nonzero()[0]
-        incorrectly_left_unchecked_button_ids = self.model.incorrectly_left_unchecked.flatten().nonzero()[0]
-        correctly_checked_button_ids = self.model.correctly_checked.flatten().nonzero()[0]
-        for id in incorrectly_checked_button_ids:
-            button = self.hand_grid_button_group.button(id)
-            button.setStyleSheet('background-color: red')
-        for id in incorrectly_left_unchecked_button_ids:
-            button = self.hand_grid_button_group.button(id)
-            button.setStyleSheet('background-color: yellow')
-        for id in correctly_checked_button_ids:
-            button = self.hand_grid_button_group.button(id)
-            button.setStyleSheet('background-color: lime')
+        states = self.hand_grid_widget.states.copy()
+        states[np.flatnonzero(self.model.incorrectly_checked)] = INCORRECTLY_CHECKED
+        states[np.flatnonzero(self.model.incorrectly_left_unchecked)] = INCORRECTLY_LEFT_UNCHECKED
+        states[np.flatnonzero(self.model.correctly_checked)] = CORRECTLY_CHECKED
+        self.hand_grid_widget.set_states(states)
 
-    def reset_colors(self):
+    def display_error_heatmap(self, error_rates):
+        """Colours each hand by its error rate. Hands that were never asked are left plain."""
 
-        for id in range(13 * 13):
-            button = self.hand_grid_button_group.button(id)
-            button.setStyleSheet('background-color: white')
+        error_rates = np.asarray(error_rates, dtype=float).ravel()
+        answered = ~np.isnan(error_rates)
+        levels = np.searchsorted([0, 0.25, 0.5, 0.75], error_rates[answered], side='left')
+        states = np.full(13 * 13, PLAIN)
+        states[answered] = np.asarray(ERROR_RATE_LEVELS)[levels]
+        self.hand_grid_widget.set_states(states)
+
+    def populate_error_heatmap_scope_widget(self):
 
-    def set_editing_mode_color(self, hand_button):
+        self.error_heatmap_scope_widget.clear()
+        self.error_heatmap_scope_widget.addItem('This spot')
+        for label_name in self.model.range_dict_schema.keys():
+            self.error_heatmap_scope_widget.addItem('Same {}'.format(label_name))
 
-        if hand_button.isChecked():
-            hand_button.setStyleSheet(self.hand_button_editing_mode_style_sheet_checked)
-        else:
-            hand_button.setStyleSheet(self.hand_button_editing_mode_style_sheet_unchecked)
+    def display_range_expression_error(self, message):
+        """Marks the range expression box as invalid, with `message` as its tooltip, or as valid if `message` is None."""
+
+        self.range_expression_edit.setStyleSheet('' if message is None else 'background-color: mistyrose')
+        self.range_expression_edit.setToolTip('' if message is None else message)
+
+    def reset_colors(self):
+
+        self.hand_grid_widget.set_states(np.full(13 * 13, PLAIN))
 
     def set_editing_mode_colors(self):
 
-        for id in range(13 * 13):
-            button = self.hand_grid_button_group.button(id)
-            self.set_editing_mode_color(button)
-
-    def __indices_to_hand_str(self, row_i, col_i):
-
-        if row_i < col_i:
-            card1 = self.model.card_ranks[row_i]
-            card2 = self.model.card_ranks[col_i]
-            suited_str = 's'
-        elif row_i > col_i:
-            card1 = self.model.card_ranks[col_i]
-            card2 = self.model.card_ranks[row_i]
-            suited_str = 'o'
-        else:
-            card1 = self.model.card_ranks[row_i]
-            card2 = self.model.card_ranks[col_i]
-            suited_str = ''
-
-        return '{}{}{}'.format(card1, card2, suited_str)
-
-    def __populate_hand_grid_layout(self):
-
-        for row_i in range(13):
-            for col_i in range(13):
-                hand_str = self.__indices_to_hand_str(row_i, col_i)
-                button_id = to_list_index(row_i, col_i)
-                button = HandGridButton()
-
-                button.setCheckable(True)
-                button.setToolButtonStyle(Qt.ToolButtonTextOnly)
-                button.setText(hand_str)
-                button.setSizePolicy(self.hand_button_size_policy)
-                self.hand_grid_button_group.addButton(button, id=button_id)
-                self.hand_grid_layout.addWidget(button, row_i, col_i)
+        self.hand_grid_widget.set_states(np.where(self.hand_grid_widget.checked, EDITING_CHECKED, EDITING_UNCHECKED))
 
     def clear_radio_button_parent_layout(self):
 
@@ -247,20 +359,13 @@ class View:
             grid_layout.addWidget(radio_button, row_i, col_i)
             button_group.addButton(radio_button, id=i)
 
-    def display_quiz_feedback(self, selected_answer: str, is_correct: bool):
+    def display_quiz_feedback(self, answer):
 
-        self.reset_colors()
-        range_to_display = self.model.quiz_feedback_range(selected_answer)
-        range_button_ids = range_to_display.flatten().nonzero()[0]
-        for id in range_button_ids:
-            button = self.hand_grid_button_group.button(id)
-            button.setStyleSheet('background-color: darkblue; color: white')
-        quiz_hand_id = to_list_index(*self.model.hand_quiz_hand_indices)
-        quiz_hand_button = self.hand_grid_button_group.button(quiz_hand_id)
-        if is_correct:
-            quiz_hand_button.setStyleSheet('background-color: darkgreen; color: white')
-        else:
-            quiz_hand_button.setStyleSheet('background-color: darkred; color: white')
+        states = np.full(13 * 13, PLAIN)
+        states[np.flatnonzero(answer.feedback_range)] = FEEDBACK_RANGE
+        quiz_hand_id = to_list_index(*answer.hand_indices)
+        states[quiz_hand_id] = QUIZ_HAND_CORRECT if answer.is_correct else QUIZ_HAND_INCORRECT
+        self.hand_grid_widget.set_states(states)
 
 
 class QuizView:
@@ -274,6 +379,9 @@ class QuizView:
         self.answer_button_layout = QVBoxLayout()
         self.answer_button_group = QButtonGroup()
         self.answer_button_group.setExclusive(False)
+        # Answer buttons are created on demand and reused. Only the first `num_answer_buttons` are shown.
+        self.answer_buttons = []
+        self.num_answer_buttons = 0
         self.checkbox_layout = QHBoxLayout()
 
         self.hand_display = QLabel()
@@ -283,6 +391,7 @@ class QuizView:
         self.next_hand_button = QPushButton('Next hand')
         self.randomize_range_checkbox = QCheckBox('Random spot')
         self.marginal_only_checkbox = QCheckBox('Marginal hands only')
+        self.spaced_repetition_checkbox = QCheckBox('Review mistakes')
 
         self.button_separator.setFrameShape(QFrame.HLine)
         self.button_separator.setFrameShadow(QFrame.Sunken)
@@ -297,9 +406,11 @@ class QuizView:
 
         self.checkbox_layout.addWidget(self.randomize_range_checkbox)
         self.checkbox_layout.addWidget(self.marginal_only_checkbox)
+        self.checkbox_layout.addWidget(self.spaced_repetition_checkbox)
 
         self.randomize_range_checkbox.setChecked(self.model.randomize_range_in_hand_quiz)
         self.marginal_only_checkbox.setChecked(self.model.hand_quiz_marginal_hands_only)
+        self.spaced_repetition_checkbox.setChecked(self.model.hand_quiz_spaced_repetition)
 
         self.hand_display.setAlignment(Qt.AlignCenter)
 
@@ -307,71 +418,70 @@ class QuizView:
 
         self.layout.setSizeConstraint(QVBoxLayout.SetFixedSize)
 
-        self.populate_window()
+    def display_question(self, question):
 
-    def populate_window(self):
+        self.set_hand_display(question.hand)
+        self.set_position_display(question.spot['Position'])
+        self.set_prior_action_display(question.prior_action)
+        self.setup_answer_buttons(question.options)
 
-        hand_str = indices_to_hand_str(*self.model.hand_quiz_hand_indices)
-        self.set_hand_display(hand_str)
-        self.set_position_display()
-        self.set_prior_action_display()
-        self.setup_answer_buttons()
+    def set_hand_display(self, hand_str):
 
-    def draw_random_hand(self, marginal_only=False):
+        self.hand_display.setText('<h1>{}</h1>'.format(hand_str))
 
-        if not marginal_only:
-            # TODO: Sample hands according to true probabilities (numbers of combos).
-            row_i = random.randint(0, 12)
-            col_i = random.randint(0, 12)
-        else:
-            # TODO
-            raise NotImplementedError()
+    def set_position_display(self, position):
 
-        return indices_to_hand_str(row_i, col_i)
+        self.position_display.setText('<b>Position:</b>\t{}'.format(position))
 
-    def set_hand_display(self, hand_str):
+    def set_prior_action_display(self, prior_action_str):
 
-        self.hand_display.setText('<h1>{}</h1>'.format(hand_str))
+        self.prior_action_display.setText('<b>Prior action:</b>\t{}'.format(prior_action_str))
+
+    def setup_answer_buttons(self, answer_option_labels):
 
-    def display_next_hand(self, marginal_only=False):
+        while len(self.answer_buttons) < len(answer_option_labels):
+            button = QPushButton()
+            button.setCheckable(True)
+            self.answer_button_layout.addWidget(button)
+            self.answer_button_group.addButton(button, len(self.answer_buttons))
+            self.answer_buttons.append(button)
 
-        hand_str = indices_to_hand_str(*self.model.hand_quiz_hand_indices)
-        self.set_hand_display(hand_str)
+        self.num_answer_buttons = len(answer_option_labels)
+        for button, label in zip(self.answer_buttons, answer_option_labels):
+            button.setText(label)
+            button.setVisible(True)
+        for button in self.answer_buttons[self.num_answer_buttons:]:
+            button.setVisible(False)
 
-    def set_position_display(self):
+        self.reset_answer_buttons()
 
-        position = self.model.current_radio_button_setting['Position']
-        self.position_display.setText('<b>Position:</b>\t{}'.format(position))
+    def visible_answer_buttons(self):
 
-    def set_prior_action_display(self):
+        return self.answer_buttons[:self.num_answer_buttons]
 
-        action = self.model.current_radio_button_setting['Action']
+    def reset_answer_buttons(self):
 
-        if action == 'RFI' and self.model.current_radio_button_setting['Position'] == 'UTG':
-            prior_action_str = self.model.prior_action_dict['UTG_RFI']
-        else:
-            action_str_or_dict = self.model.prior_action_dict[action]
-            if type(action_str_or_dict) is str:
-                prior_action_str = action_str_or_dict
-            elif type(action_str_or_dict) is dict:
-                villain_pos = self.model.current_radio_button_setting['VS']
-                prior_action_str = action_str_or_dict[villain_pos]
-            else:
-                raise ValueError
+        self.answer_button_group.blockSignals(True)
+        for button in self.answer_buttons:
+            if button.isChecked():
+                button.setChecked(False)
+            self.set_answer_button_color(button, 'white')
+        self.answer_button_group.blockSignals(False)
 
-        self.prior_action_display.setText('<b>Prior action:</b>\t{}'.format(prior_action_str))
+    def display_answer(self, answer):
 
-    def setup_answer_buttons(self):
+        for button in self.visible_answer_buttons():
+            if button.text() == answer.selected_option:
+                self.set_answer_button_color(button, 'green' if answer.is_correct else 'red')
+            elif button.text() == answer.correct_option and not answer.is_correct:
+                self.set_answer_button_color(button, 'green')
 
-        clear_layout(self.answer_button_layout)
+    @staticmethod
+    def set_answer_button_color(button, color):
 
-        correct_action = self.model.current_radio_button_setting['Action']
-        answer_option_labels = self.model.hand_quiz_answer_dict['options'][correct_action]
-        for id, label in enumerate(answer_option_labels):
-            button = QPushButton(label)
-            button.setCheckable(True)
-            self.answer_button_layout.addWidget(button)
-            self.answer_button_group.addButton(button, id)
+        style_sheet = 'background-color: {}'.format(color)
+        if button.styleSheet() != style_sheet:
+            button.setStyleSheet(style_sheet)
 
 
 # TODO: Here's a hardwired dict that assigns "Prior action" strings to radio button settings. Add non-hardwired
@@ -423,6 +533,7 @@ if __name__ == '__main__':
     model.set_radio_button_setting({'Position': 1, 'Action': 3, 'VS': 3})
 
     quiz_view = QuizView(model)
+    quiz_view.display_question(QuizSession(model).current_question())
     quiz_view.window.show()
 
     sys.exit(app.exec_())
\ No newline at end of file